@@ -0,0 +1,290 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+import udp
+import wire
+from tokens import load_secret, token_hasher
+
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+SERVER_HOST = 'localhost'
+SERVER_PORT = 51001
+
+RECV_BUFFER_SIZE = 65535
+STARTUP_TIMEOUT = 5
+POOL_SIZE = 1024
+
+DEFAULT_MIX = 'itr=70,itv=20,gtr=5,gtv=4,bad=1'
+MESSAGE_KINDS = ('itr', 'itv', 'gtr', 'gtv', 'bad')
+
+
+# SERVER PROCESS
+
+def start_server(backend, workers, address):
+    host, port = address
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--workers', str(workers), '--backend', backend,
+                                '--host', host, '--port', str(port)],
+                               stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(address)
+    except RuntimeError:
+        stop_server(process)
+        raise
+    return process
+
+def wait_until_ready(address):
+    probe, address = udp.client_socket(*address)
+    probe.settimeout(0.1)
+    deadline = time.time() + STARTUP_TIMEOUT
+    try:
+        while time.time() < deadline:
+            probe.sendto(wire.individual_token_request('probe', 0), address)
+            try:
+                probe.recvfrom(RECV_BUFFER_SIZE)
+                return
+            except (socket.timeout, ConnectionRefusedError):
+                pass
+        raise RuntimeError("server did not start")
+    finally:
+        probe.close()
+
+def stop_server(process):
+    process.terminate()
+    process.wait()
+
+
+# MESSAGES
+
+# Same key as a server started from this environment, so valid SAS stay valid
+base_hasher = token_hasher(load_secret())
+
+def make_token(data):
+    hasher = base_hasher.copy()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+def make_sas(student_id, nonce):
+    token = make_token((student_id + str(nonce)).encode('ascii'))
+    return wire.sas_to_bin(f"{student_id}:{nonce}:{token}")
+
+def malformed_messages(student_id):
+    # Each of these makes the server answer with a 256 error
+    return [
+        wire.HEADER.pack(99) + b'x' * 16,                                   # INVALID_MESSAGE_CODE
+        wire.individual_token_request(student_id, 0)[:10],                  # INCORRECT_MESSAGE_LENGTH
+        wire.GROUP_HEADER.pack(wire.GROUP_TOKEN_REQUEST, 3) + make_sas(student_id, 0),   # INVALID_PARAMETER
+    ]
+
+def build_pool(kind, sender, group_size):
+    student_id = f"load{sender:04d}"
+    if kind == 'itr':
+        return [wire.individual_token_request(student_id, nonce) for nonce in range(POOL_SIZE)]
+    elif kind == 'itv':
+        return [wire.individual_token_validation(make_sas(student_id, nonce)) for nonce in range(POOL_SIZE)]
+    elif kind == 'gtr':
+        return [wire.group_token_request([make_sas(student_id, first + i) for i in range(group_size)])
+                for first in range(0, POOL_SIZE, group_size)]
+    elif kind == 'gtv':
+        pool = []
+        for first in range(0, POOL_SIZE, group_size):
+            sas_list = [make_sas(student_id, first + i) for i in range(group_size)]
+            token = make_token(b''.join(sas_list)).encode('ascii')
+            pool.append(wire.group_token_validation(sas_list, token))
+        return pool
+    return malformed_messages(student_id)
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        if kind not in MESSAGE_KINDS:
+            raise ValueError(f"unknown message kind {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+def request_key(message):
+    # Key of the reply to `message`; malformed requests all share `None`
+    message_type = wire.message_type(message)
+    if message_type == wire.INDIVIDUAL_TOKEN_REQUEST and len(message) == wire.ITR_REQUEST.size:
+        return wire.INDIVIDUAL_TOKEN_RESPONSE, bytes(message[2:18])
+    elif message_type == wire.INDIVIDUAL_TOKEN_VALIDATION:
+        return wire.INDIVIDUAL_TOKEN_STATUS, bytes(message[2:82])
+    elif message_type == wire.GROUP_TOKEN_REQUEST and len(message) == 4 + wire.group_count(message, 2) * wire.SAS_SIZE:
+        return wire.GROUP_TOKEN_RESPONSE, bytes(message[4:])
+    elif message_type == wire.GROUP_TOKEN_VALIDATION:
+        return wire.GROUP_TOKEN_STATUS, bytes(message[4:-wire.TOKEN_SIZE])
+    return None
+
+def reply_key(data):
+    message_type = wire.message_type(data)
+    if message_type == wire.INDIVIDUAL_TOKEN_RESPONSE:
+        return message_type, bytes(data[2:18])
+    elif message_type == wire.INDIVIDUAL_TOKEN_STATUS:
+        return message_type, bytes(data[2:82])
+    elif message_type == wire.GROUP_TOKEN_RESPONSE:
+        return message_type, bytes(data[4:-wire.TOKEN_SIZE])
+    elif message_type == wire.GROUP_TOKEN_STATUS:
+        return message_type, bytes(data[4:-1 - wire.TOKEN_SIZE])
+    return None
+
+
+# LOAD
+
+def run_sender(sender, address, options, results):
+    # Keeps `window` requests in flight on its own socket and records the
+    # latency of every reply. Requests unanswered after `timeout` are lost.
+    rng = random.Random(sender)
+    mix = parse_mix(options.mix)
+    pools = {kind: build_pool(kind, sender, options.group_size) for kind in mix}
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=POOL_SIZE)
+    schedule = [rng.choice(pools[kind]) for kind in kinds]
+
+    sock, address = udp.client_socket(*address)
+    outstanding = {}                # request id -> (send time, key)
+    by_key = {}                     # reply key -> deque of request ids
+    order = deque()                 # request ids in send order, for timeouts
+    latencies = []
+    sent, lost, errors = 0, 0, 0
+    next_id = 0
+
+    start = time.perf_counter()
+    stop_at = start + options.duration
+    while True:
+        now = time.perf_counter()
+        while len(outstanding) < options.window and now < stop_at:
+            message = schedule[next_id % len(schedule)]
+            key = request_key(message)
+            sock.sendto(message, address)
+            outstanding[next_id] = (time.perf_counter(), key)
+            by_key.setdefault(key, deque()).append(next_id)
+            order.append(next_id)
+            next_id += 1
+            sent += 1
+        if not outstanding:
+            break
+
+        while order and order[0] not in outstanding:
+            order.popleft()
+        oldest_sent, _ = outstanding[order[0]]
+        remaining = oldest_sent + options.timeout - time.perf_counter()
+        try:
+            # An overdue request is lost without waiting: a timeout of 0
+            # would make the socket non-blocking instead
+            if remaining <= 0:
+                raise socket.timeout
+            sock.settimeout(remaining)
+            data, _ = sock.recvfrom(RECV_BUFFER_SIZE)
+            received_at = time.perf_counter()
+            if wire.message_type(data) == wire.ERROR:
+                errors += 1
+                key = None
+            else:
+                key = reply_key(data)
+            ids = by_key.get(key)
+            if ids:
+                request_id = ids.popleft()
+                sent_at, _ = outstanding.pop(request_id)
+                latencies.append(received_at - sent_at)
+        except socket.timeout:
+            request_id = order.popleft()
+            _, key = outstanding.pop(request_id)
+            by_key[key].remove(request_id)
+            lost += 1
+    elapsed = time.perf_counter() - start
+    sock.close()
+    results.put({"sent": sent, "lost": lost, "errors": errors,
+                 "elapsed": elapsed, "latencies": latencies})
+
+def run_load(address, options):
+    results = multiprocessing.Queue()
+    senders = [multiprocessing.Process(target=run_sender, args=(i, address, options, results))
+               for i in range(options.senders)]
+    for sender in senders:
+        sender.start()
+    reports = [results.get() for _ in senders]
+    for sender in senders:
+        sender.join()
+    return summarize(reports)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarize(reports):
+    latencies = sorted(latency for report in reports for latency in report["latencies"])
+    sent = sum(report["sent"] for report in reports)
+    lost = sum(report["lost"] for report in reports)
+    elapsed = max(report["elapsed"] for report in reports)
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    return {
+        "sent": sent,
+        "received": len(latencies),
+        "errors": sum(report["errors"] for report in reports),
+        "lost": lost,
+        "loss": lost / sent if sent else 0.0,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "p999_ms": ms(percentile(latencies, 0.999)),
+    }
+
+
+# COMMAND LINE INTERFACE
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator and latency benchmark for the authenticator")
+    parser.add_argument('--backends', nargs='+', default=['socket', 'batch'],
+                        choices=['socket', 'batch', 'asyncio'],
+                        help="server loops to start and compare (default: socket batch)")
+    parser.add_argument('--workers', type=int, default=1, help="server worker processes (default: 1)")
+    parser.add_argument('--external', action='store_true',
+                        help="drive an already running server at --host/--port instead of starting one")
+    parser.add_argument('--host', default=SERVER_HOST,
+                        help=f"server address, IPv4 or IPv6 (default: {SERVER_HOST})")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"weighted message kinds among {', '.join(MESSAGE_KINDS)} (default: {DEFAULT_MIX})")
+    parser.add_argument('--group-size', type=int, default=4, help="SAS per gtr/gtv message (default: 4)")
+    parser.add_argument('--senders', type=int, default=4, help="concurrent sender processes (default: 4)")
+    parser.add_argument('--window', type=int, default=32, help="requests in flight per sender (default: 32)")
+    parser.add_argument('--duration', type=float, default=5, help="seconds of load per run (default: 5)")
+    parser.add_argument('--timeout', type=float, default=1,
+                        help="seconds before a request counts as lost (default: 1)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    address = (args.host, args.port)
+    results = {}
+    for backend in (['external'] if args.external else args.backends):
+        process = None if args.external else start_server(backend, args.workers, address)
+        try:
+            results[backend] = run_load(address, args)
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    if args.json:
+        print(json.dumps({"mix": args.mix, "senders": args.senders, "window": args.window,
+                          "workers": args.workers, "results": results}, indent=2))
+        return
+    print(f"{'backend':<10} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'p999 ms':>9} {'errors':>8} {'loss':>8}")
+    for backend, result in results.items():
+        print(f"{backend:<10} {result['throughput']:>10.0f} {str(result['p50_ms']):>9} {str(result['p99_ms']):>9} "
+              f"{str(result['p999_ms']):>9} {result['errors']:>8} {result['loss']:>8.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,301 @@
+import heapq
+import random
 import socket
-import struct
 import sys
 import time
+from collections import OrderedDict, defaultdict, deque
 
+import udp
+import wire
+from retransmit import RetransmissionTimer, request
+from wire import sas_to_bin, bin_to_sas, bin_to_gas, gas_to_bin
 
-TIMEOUT = 20
-TIMEOUT_THRESHOLD = 50
+
+RECV_BUFFER_SIZE = 65535
+
+# With --fragment, group messages larger than this are sent as type 9
+# fragments. Servers that don't support them only get single datagrams, so
+# that stays the default.
+FRAGMENT_THRESHOLD = 1024
+
+# Shared by every request so the RTT estimate carries over between them
+timer = RetransmissionTimer()
 
 
 #Error code
-ERROR = 256
-INVALID_MESSAGE_CODE = 1
-INCORRECT_MESSAGE_LENGTH = 2
-INVALID_PARAMETER = 3
-INVALID_SINGLE_TOKEN = 4
-ASCII_DECODE_ERROR = 5
+ERROR = wire.ERROR
+INVALID_MESSAGE_CODE = wire.INVALID_MESSAGE_CODE
+INCORRECT_MESSAGE_LENGTH = wire.INCORRECT_MESSAGE_LENGTH
+INVALID_PARAMETER = wire.INVALID_PARAMETER
+INVALID_SINGLE_TOKEN = wire.INVALID_SINGLE_TOKEN
+ASCII_DECODE_ERROR = wire.ASCII_DECODE_ERROR
 
 
 # INDIVIDUAL TOKENS
 
 def request_individual_token(server_address, student_id, nonce):
-    message = struct.pack('!H', 1) + student_id.ljust(12).encode('ascii') + struct.pack('!I', nonce)
-    client_socket.sendto(message, server_address)
+    return send_request(server_address, wire.individual_token_request(student_id, nonce))
 
 def validate_individual_token(server_address, sas):
-    message = struct.pack('!H', 3) + sas
-    client_socket.sendto(message, server_address)
+    return send_request(server_address, wire.individual_token_validation(sas))
 
 
 # GROUP TOKENS
     
-def request_group_token(server_address, sas_list):
-    message = struct.pack('!HH', 5, len(sas_list)) + b''.join(sas_list)
-    client_socket.sendto(message, server_address)
+def request_group_token(server_address, sas_list, fragment=False):
+    return send_group_message(server_address, wire.group_token_request(sas_list), fragment)
+
+def validate_group_token(server_address, gas_list, fragment=False):
+    return send_group_message(server_address, wire.group_token_validation(gas_list[:-1], gas_list[-1]), fragment)
 
-def validate_group_token(server_address, gas_list):
-    message = struct.pack('!HH', 7, len(gas_list)-1) + b''.join(gas_list)
-    client_socket.sendto(message, server_address)
+def send_group_message(server_address, message, fragment=False):
+    if not fragment or len(message) <= FRAGMENT_THRESHOLD:
+        return send_request(server_address, message)
+    return send_fragments(server_address, message)
 
+def send_fragments(server_address, message):
+    # Sends every fragment not yet acknowledged until the server answers with
+    # the result of the whole transfer (or an error)
+    transfer_id = random.getrandbits(32)
+    frames = wire.split_fragments(message, transfer_id)
+    unacked = set(range(len(frames)))
+    for attempt in range(timer.max_retries + 1):
+        for seq in sorted(unacked):
+            client_socket.sendto(frames[seq], server_address)
+        deadline = time.monotonic() + timer.timeout(attempt)
+        try:
+            while True:
+                # Resend once the deadline has passed; a timeout of 0 would
+                # make the socket non-blocking instead
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                client_socket.settimeout(remaining)
+                binary_data, _ = client_socket.recvfrom(RECV_BUFFER_SIZE)
+                message_type = wire.message_type(binary_data)
+                if message_type == ERROR:
+                    return binary_data
+                if message_type == wire.FRAGMENT_ACK:
+                    _, _, ack_id, seq, _ = wire.FRAGMENT_HEADER.unpack_from(binary_data)
+                    if ack_id == transfer_id:
+                        unacked.discard(seq)
+                elif message_type == wire.FRAGMENT_RESULT:
+                    if wire.FRAGMENT_RESULT_HEADER.unpack_from(binary_data)[2] == transfer_id:
+                        return binary_data
+        except socket.timeout:
+            continue
+    raise socket.timeout
 
-# PARSERS
 
-def sas_to_bin(data):
-    student_id, nonce, token = data.split(':')
-    student_id_bytes = student_id.encode('ascii').ljust(12)
-    nonce_bytes = struct.pack('!I', int(nonce))
-    token_bytes = token.encode('ascii')
-    return (student_id_bytes + nonce_bytes + token_bytes)
+# REPLY MATCHING
 
-def bin_to_sas(data):
-    student_id = data[:12].decode('ascii').strip()
-    nonce = str(struct.unpack('!I', data[12:16])[0])
-    token = data[16:].decode('ascii')
-    return f"{student_id}:{nonce}:{token}"
+def request_key(message):
+    # Key of the reply to `message`: its type and the fields it echoes
+    message_type = wire.message_type(message)
+    if message_type == wire.INDIVIDUAL_TOKEN_REQUEST:
+        return wire.INDIVIDUAL_TOKEN_RESPONSE, bytes(message[2:18])
+    elif message_type == wire.INDIVIDUAL_TOKEN_VALIDATION:
+        return wire.INDIVIDUAL_TOKEN_STATUS, bytes(message[2:82])
+    elif message_type == wire.GROUP_TOKEN_REQUEST:
+        return wire.GROUP_TOKEN_RESPONSE, bytes(message[4:])
+    return wire.GROUP_TOKEN_STATUS, bytes(message[2:])
 
-def bin_to_gas(data):
-    n = struct.unpack('!H', data[:2])[0]
-    sas_list = [bin_to_sas(data[2+i*80 : 2+(i+1)*80]) for i in range(n)]
-    token = data[-64:].decode('ascii')
-    return sas_list, token
+def reply_key(binary_data):
+    message_type = wire.message_type(binary_data)
+    if message_type == wire.INDIVIDUAL_TOKEN_RESPONSE:
+        return message_type, bytes(binary_data[2:18])
+    elif message_type == wire.INDIVIDUAL_TOKEN_STATUS:
+        return message_type, bytes(binary_data[2:82])
+    elif message_type == wire.GROUP_TOKEN_RESPONSE:
+        n = wire.group_count(binary_data, 2)
+        return message_type, bytes(binary_data[4:4 + n * wire.SAS_SIZE])
+    elif message_type == wire.GROUP_TOKEN_STATUS:
+        return message_type, bytes(binary_data[2:-1])
+    return None
 
-def gas_to_bin(data):
-    gas = data.split('+')
-    sas_list_bytes = [sas_to_bin(gas[i]) for i in range(len(gas)-1)]
-    token_bytes = gas[-1].encode('ascii')
-    return sas_list_bytes, token_bytes
+def send_request(server_address, message):
+    key = request_key(message)
+    def is_reply(binary_data):
+        return wire.message_type(binary_data) == ERROR or reply_key(binary_data) == key
+    return request(client_socket, message, server_address, is_reply, timer, RECV_BUFFER_SIZE)
 
 
 # ERROR HANDLING 
 
-def handle_error(error_code):
+def error_text(error_code):
     if error_code == INVALID_MESSAGE_CODE:
-        print("Error: Invalid message code")
+        return "Error: Invalid message code"
     elif error_code == INCORRECT_MESSAGE_LENGTH:
-        print("Error: Incorrect message length")
+        return "Error: Incorrect message length"
     elif error_code == INVALID_PARAMETER:
-        print("Error: Invalid parameter")
+        return "Error: Invalid parameter"
     elif error_code == INVALID_SINGLE_TOKEN:
-        print("Error: Invalid single token")
+        return "Error: Invalid single token"
     elif error_code == ASCII_DECODE_ERROR:
-        print("Error: ASCII decode error")
+        return "Error: ASCII decode error"
     else:
-        print("Unknown error")
+        return "Unknown error"
+
+def handle_error(error_code):
+    print(error_text(error_code))
+
+
+# BATCH MODE
+
+BATCH_WINDOW = 64
+
+def build_request(args):
+    # `args` are the words of one command as given on the command line after
+    # <port>. Returns the message and the key its reply will be matched on.
+    command = args[0]
+    if command == 'itr':
+        if len(args) != 3:
+            raise ValueError("Usage: itr <id> <nonce>")
+        message = wire.individual_token_request(args[1], int(args[2]))
+    elif command == 'itv':
+        if len(args) != 2:
+            raise ValueError("Usage: itv <SAS>")
+        message = wire.individual_token_validation(sas_to_bin(args[1]))
+    elif command == 'gtr':
+        if len(args) < 3 or len(args) != int(args[1]) + 2:
+            raise ValueError("Usage: gtr <N> <SAS1> <SAS2> ... <SASN>")
+        message = wire.group_token_request([sas_to_bin(sas) for sas in args[2:]])
+    elif command == 'gtv':
+        if len(args) != 3:
+            raise ValueError("Usage: gtv <N> <SAS1>+<SAS2>+...+<SASN>+<GAS>")
+        sas_list, token = gas_to_bin(args[2])
+        message = wire.group_token_validation(sas_list, token)
+    else:
+        raise ValueError(f"Unknown command {command}")
+    return message, request_key(message)
+
+def format_reply(binary_data):
+    message_type = wire.message_type(binary_data)
+    if message_type == ERROR:
+        return error_text(wire.error_code(binary_data))
+    elif message_type == wire.INDIVIDUAL_TOKEN_RESPONSE:
+        return bin_to_sas(binary_data, 2)
+    elif message_type == wire.GROUP_TOKEN_RESPONSE:
+        gas, token = bin_to_gas(memoryview(binary_data)[2:])
+        return '+'.join(gas) + "+" + token
+    # Status 0 = pass, 1 = not pass
+    return str(binary_data[-1])
+
+def run_batch(server_address, lines, window=BATCH_WINDOW):
+    # Keeps up to `window` requests in flight on one socket, matches replies
+    # by their echoed fields and resends on the shared retransmission timer.
+    # Results are printed in input order. Error replies echo nothing, so one
+    # is only taken as the reply of the single request in flight. An error
+    # that arrives while others are in flight stops new requests; those left
+    # unanswered once the rest are done are then resent one at a time.
+    requests = []
+    outputs = []
+    for line in lines:
+        args = line.split()
+        if not args or args[0].startswith('#'):
+            continue
+        try:
+            requests.append(build_request(args))
+            outputs.append(None)
+        except ValueError as e:
+            requests.append(None)
+            outputs.append(f"Error: {e}")
+
+    active = OrderedDict()          # index -> (attempt, time sent)
+    waiting = defaultdict(deque)    # reply key -> indexes
+    deadlines = []                  # (deadline, index, attempt)
+    suspects = deque()              # (index, attempt) to resend alone
+    isolating = False               # an error came that can't be attributed yet
+    next_index, printed = 0, 0
+
+    def send(index, attempt):
+        message, _ = requests[index]
+        client_socket.sendto(message, server_address)
+        now = time.monotonic()
+        active[index] = (attempt, now)
+        heapq.heappush(deadlines, (now + timer.timeout(attempt), index, attempt))
+
+    def finish(index, output):
+        del active[index]
+        waiting[requests[index][1]].remove(index)
+        outputs[index] = output
+
+    while printed < len(outputs):
+        if isolating and not active:
+            if suspects:
+                send(*suspects.popleft())
+            else:
+                isolating = False
+        while len(active) < (1 if isolating else window) and next_index < len(requests):
+            if requests[next_index] is not None:
+                waiting[requests[next_index][1]].append(next_index)
+                send(next_index, 0)
+            next_index += 1
+
+        # An expired deadline is handled below without waiting: a timeout of
+        # 0 would make the socket non-blocking instead
+        remaining = deadlines[0][0] - time.monotonic() if active else 0
+        if remaining > 0:
+            client_socket.settimeout(remaining)
+            try:
+                binary_data, _ = client_socket.recvfrom(RECV_BUFFER_SIZE)
+                if wire.message_type(binary_data) == ERROR:
+                    index = next(iter(active)) if len(active) == 1 else None
+                    isolating = isolating or index is None
+                else:
+                    indexes = waiting.get(reply_key(binary_data))
+                    index = indexes[0] if indexes else None
+                if index is not None:
+                    attempt, sent_at = active[index]
+                    if attempt == 0:
+                        timer.observe(time.monotonic() - sent_at)
+                    finish(index, format_reply(binary_data))
+            except socket.timeout:
+                pass
+
+        now = time.monotonic()
+        while deadlines and deadlines[0][0] <= now:
+            _, index, attempt = heapq.heappop(deadlines)
+            if index not in active or active[index][0] != attempt:
+                continue
+            if attempt >= timer.max_retries:
+                finish(index, "Timeout: no reply from server")
+            elif isolating and len(active) > 1:
+                # Maybe the request the error was for
+                del active[index]
+                suspects.append((index, attempt + 1))
+            else:
+                send(index, attempt + 1)
+
+        while printed < len(outputs) and outputs[printed] is not None:
+            print(outputs[printed])
+            printed += 1
 
 # COMMAND LINE INTERFACE
 
         
 def cli():
     global client_socket
-    # Create a UDP socket that supports both IPv4 and IPv6
-    try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    except OSError:
-        # If IPv4 is not supported, attempt to create a socket with IPv6
-        client_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-    server_address = (sys.argv[1], int(sys.argv[2]))
+    # Create a UDP socket in the family of the server's address, IPv4 or IPv6
+    client_socket, server_address = udp.client_socket(sys.argv[1], int(sys.argv[2]))
+    fragment = '--fragment' in sys.argv
+    if fragment:
+        sys.argv.remove('--fragment')
     
-    client_socket.settimeout(TIMEOUT)
-
-    last_request_time = time.time()
+    if sys.argv[3] == 'batch':
+        if len(sys.argv) > 6:
+            print("Usage: ./client.py <host> <port> batch [<file>|-] [<window>]")
+            return
+        source = sys.argv[4] if len(sys.argv) > 4 else '-'
+        window = int(sys.argv[5]) if len(sys.argv) > 5 else BATCH_WINDOW
+        if source == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(source) as f:
+                lines = f.read().splitlines()
+        run_batch(server_address, lines, window)
+        client_socket.close()
+        return
 
     while True:
         try:
@@ -110,14 +307,13 @@ def cli():
                     return
                 student_id = sys.argv[4]
                 nonce = int(sys.argv[5])
-                request_individual_token(server_address, student_id, nonce)
-                binary_data, _ = client_socket.recvfrom(1024)
+                binary_data = request_individual_token(server_address, student_id, nonce)
                 # Decode message type, see if there is an error
-                message_type = int.from_bytes(binary_data[:2], byteorder='big')
+                message_type = wire.message_type(binary_data)
                 if message_type ==  ERROR:
-                    handle_error(struct.unpack('!H', binary_data[2:4])[0])
+                    handle_error(wire.error_code(binary_data))
                 else:
-                    print(bin_to_sas(binary_data[2:]))
+                    print(bin_to_sas(binary_data, 2))
                 break
 
             elif command == 'itv':
@@ -125,55 +321,56 @@ def cli():
                     print("Usage: ./client.py <host> <port> itv <SAS>")
                     return
                 bin_sas = sas_to_bin(sys.argv[4])
-                validate_individual_token(server_address, bin_sas)
-                binary_data, _ = client_socket.recvfrom(1024)
+                binary_data = validate_individual_token(server_address, bin_sas)
                 # Decode message type, see if there is an error
-                message_type = int.from_bytes(binary_data[:2], byteorder='big')
+                message_type = wire.message_type(binary_data)
                 if message_type ==  ERROR:
-                    handle_error(struct.unpack('!H', binary_data[2:4])[0])
+                    handle_error(wire.error_code(binary_data))
                 else:
                     # Status 0 = pass, 1 = not pass
-                    status = struct.unpack('B', binary_data[-1:])[0]
+                    status = binary_data[-1]
                     print(status)
                 break
     
             elif command == 'gtr':
                 if len(sys.argv) < 6:
-                    print("Usage: ./client.py <host> <port> gtr <N> <SAS1> <SAS2> ... <SASN>")
+                    print("Usage: ./client.py <host> <port> gtr <N> <SAS1> <SAS2> ... <SASN> [--fragment]")
                     return
                 n = int(sys.argv[4])
                 if len(sys.argv) != n + 5:
                     print("Incorrect number of SAS provided")
                     return
                 bin_sas_list = [sas_to_bin(sys.argv[i]) for i in range(5, 5 + n)]
-                request_group_token(server_address, bin_sas_list)
-                binary_data, _ = client_socket.recvfrom(1024)
+                binary_data = request_group_token(server_address, bin_sas_list, fragment)
                 # Decode message type, see if there is an error
-                message_type = int.from_bytes(binary_data[:2], byteorder='big')
+                message_type = wire.message_type(binary_data)
                 if message_type ==  ERROR:
-                    handle_error(struct.unpack('!H', binary_data[2:4])[0])
+                    handle_error(wire.error_code(binary_data))
+                elif message_type == wire.FRAGMENT_RESULT:
+                    # The server doesn't echo fragmented SAS, only the token
+                    token = binary_data[wire.FRAGMENT_RESULT_HEADER.size:].decode('ascii')
+                    print('+'.join(sys.argv[5:5 + n]) + "+" + token)
                 else:
-                    gas, token = bin_to_gas(binary_data[2:])
+                    gas, token = bin_to_gas(memoryview(binary_data)[2:])
                     print('+'.join(gas) + "+" + token)
                 break
     
             elif command == 'gtv':
                 if len(sys.argv) != 6:
-                    print("Usage: ./client.py <host> <port> gtv <SAS1>+<SAS2>+...+<SASN>+<GAS>")
+                    print("Usage: ./client.py <host> <port> gtv <SAS1>+<SAS2>+...+<SASN>+<GAS> [--fragment]")
                     return
                 n = int(sys.argv[4])
                 gas = sys.argv[5]
                 bin_sas_list, bin_token = gas_to_bin(gas)
                 bin_sas_list.append(bin_token)
-                validate_group_token(server_address, bin_sas_list)
-                binary_data, _ = client_socket.recvfrom(1024)
+                binary_data = validate_group_token(server_address, bin_sas_list, fragment)
                 # Decode message type, see if there is an error
-                message_type = int.from_bytes(binary_data[:2], byteorder='big')
+                message_type = wire.message_type(binary_data)
                 if message_type ==  ERROR:
-                    handle_error(struct.unpack('!H', binary_data[2:4])[0])
+                    handle_error(wire.error_code(binary_data))
                 else:
                     # Status 0 = pass, 1 = not pass
-                    status = struct.unpack('B', binary_data[-1:])[0]
+                    status = binary_data[-1]
                     print(status)
                 break
     
@@ -182,11 +379,9 @@ def cli():
                 break
 
         except socket.timeout:
-            if time.time() - last_request_time > TIMEOUT_THRESHOLD:
-                print("Timeout occurred. Resending request...")
-                last_request_time = time.time()
-            else:
-               print("Timeout occurred, but not enough time has passed since the last request.")
+            # request() already resent with backoff up to timer.max_retries
+            print("Timeout occurred. No reply from server.")
+            break
         except Exception as e:
             print("Exceptional error:", e)
             break
@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+
+import wire
+from grouphash import GroupError, GroupStream
+from wire import (INCORRECT_MESSAGE_LENGTH, INVALID_PARAMETER, GROUP_TOKEN_REQUEST,
+                  GROUP_TOKEN_VALIDATION, error_message)
+
+
+# LIMITS
+
+TRANSFER_TIMEOUT = 30           # seconds without fragments before a transfer is dropped
+MAX_TRANSFERS = 1024            # transfers in progress, the least recently active is evicted
+MAX_PENDING_BYTES = 64 * 1024   # out-of-order fragments buffered per transfer
+COMPLETED_CACHE_SIZE = 1024     # finished transfers whose reply is kept for retransmits
+
+
+# REASSEMBLY
+
+class Transfer:
+    def __init__(self, inner_type, total, stream):
+        self.inner_type = inner_type
+        self.total = total
+        self.stream = stream
+        self.next_seq = 0
+        self.pending = {}
+        self.pending_bytes = 0
+        self.deadline = 0
+
+
+class Reassembler:
+    def __init__(self, check_sas, new_hasher):
+        self.check_sas = check_sas
+        self.new_hasher = new_hasher
+        self.transfers = OrderedDict()
+        self.completed = OrderedDict()
+
+    def handle(self, data, client_address):
+        # Returns the reply for one fragment: an ack, the final result, an
+        # error, or None when the fragment is dropped and must be resent
+        if len(data) < wire.FRAGMENT_HEADER.size:
+            return error_message(INCORRECT_MESSAGE_LENGTH)
+        _, inner_type, transfer_id, seq, total = wire.FRAGMENT_HEADER.unpack_from(data)
+        if inner_type not in (GROUP_TOKEN_REQUEST, GROUP_TOKEN_VALIDATION) or seq >= total:
+            return error_message(INVALID_PARAMETER)
+
+        key = (client_address, transfer_id)
+        reply = self.completed.get(key)
+        if reply is not None:
+            return reply
+
+        now = time.monotonic()
+        self.expire(now)
+        transfer = self.transfers.get(key)
+        if transfer is None:
+            if len(self.transfers) >= MAX_TRANSFERS:
+                self.transfers.popitem(last=False)
+            check_sas = self.check_sas if inner_type == GROUP_TOKEN_REQUEST else None
+            transfer = Transfer(inner_type, total, GroupStream(inner_type, check_sas, self.new_hasher()))
+            self.transfers[key] = transfer
+        elif transfer.inner_type != inner_type or transfer.total != total:
+            return error_message(INVALID_PARAMETER)
+        transfer.deadline = now + TRANSFER_TIMEOUT
+        self.transfers.move_to_end(key)
+
+        payload = data[wire.FRAGMENT_HEADER.size:]
+        if seq > transfer.next_seq and seq not in transfer.pending:
+            if transfer.pending_bytes + len(payload) > MAX_PENDING_BYTES:
+                return None
+            transfer.pending[seq] = bytes(payload)
+            transfer.pending_bytes += len(payload)
+        elif seq == transfer.next_seq:
+            try:
+                self.feed(transfer, payload)
+            except GroupError as e:
+                return self.finish(key, error_message(e.error_code))
+            if transfer.next_seq == transfer.total:
+                if not transfer.stream.complete():
+                    return self.finish(key, error_message(INCORRECT_MESSAGE_LENGTH))
+                result_type, result = transfer.stream.result()
+                return self.finish(key, wire.fragment_result(result_type, transfer_id,
+                                                             transfer.stream.count, result))
+        return wire.fragment_ack(inner_type, transfer_id, seq, total)
+
+    def feed(self, transfer, payload):
+        transfer.stream.feed(payload)
+        transfer.next_seq += 1
+        while transfer.next_seq in transfer.pending:
+            payload = transfer.pending.pop(transfer.next_seq)
+            transfer.pending_bytes -= len(payload)
+            transfer.stream.feed(payload)
+            transfer.next_seq += 1
+
+    def finish(self, key, reply):
+        del self.transfers[key]
+        self.completed[key] = reply
+        if len(self.completed) > COMPLETED_CACHE_SIZE:
+            self.completed.popitem(last=False)
+        return reply
+
+    def expire(self, now):
+        while self.transfers:
+            key, transfer = next(iter(self.transfers.items()))
+            if transfer.deadline > now:
+                break
+            del self.transfers[key]
@@ -0,0 +1,88 @@
+import wire
+from wire import (INCORRECT_MESSAGE_LENGTH, INVALID_PARAMETER, SAS_SIZE, TOKEN_SIZE,
+                  GROUP_TOKEN_REQUEST, GROUP_TOKEN_VALIDATION)
+
+
+class GroupError(Exception):
+    def __init__(self, error_code):
+        super().__init__(error_code)
+        self.error_code = error_code
+
+
+# INCREMENTAL GROUP HASHING
+
+class GroupStream:
+    # Consumes the body of a type 5 or 7 message (N | SAS-1 ... SAS-N [| token])
+    # in one pass, either whole or one fragment at a time. With `check_sas`
+    # every SAS is verified as soon as it is complete and then fed to `hasher`
+    # as a memoryview; without it the SAS bytes are hashed as they arrive.
+    # Only a partial SAS is ever copied, when it spans two chunks.
+    def __init__(self, inner_type, check_sas, hasher):
+        self.inner_type = inner_type
+        self.check_sas = check_sas
+        self.hasher = hasher
+        self.count = None
+        self.sas_bytes_left = 0
+        self.carry = bytearray()
+        self.token = bytearray()
+
+    def feed(self, chunk):
+        view = memoryview(chunk)
+        if self.count is None:
+            if len(view) < 2:
+                raise GroupError(INCORRECT_MESSAGE_LENGTH)
+            self.count = wire.group_count(view)
+            if self.count <= 0:
+                raise GroupError(INVALID_PARAMETER)
+            self.sas_bytes_left = self.count * SAS_SIZE
+            view = view[2:]
+
+        size = min(len(view), self.sas_bytes_left)
+        if size:
+            self.sas_bytes_left -= size
+            if self.check_sas is None:
+                self.hasher.update(view[:size])
+            else:
+                self.feed_records(view[:size])
+            view = view[size:]
+
+        if len(view):
+            if self.inner_type != GROUP_TOKEN_VALIDATION or len(self.token) + len(view) > TOKEN_SIZE:
+                raise GroupError(INCORRECT_MESSAGE_LENGTH)
+            self.token += view
+
+    def feed_records(self, view):
+        if self.carry:
+            needed = SAS_SIZE - len(self.carry)
+            self.carry += view[:needed]
+            view = view[needed:]
+            if len(self.carry) < SAS_SIZE:
+                return
+            self.feed_record(memoryview(self.carry))
+            self.carry = bytearray()
+        whole = len(view) - len(view) % SAS_SIZE
+        for offset in range(0, whole, SAS_SIZE):
+            self.feed_record(view[offset:offset + SAS_SIZE])
+        self.carry += view[whole:]
+
+    def feed_record(self, sas):
+        error_code = self.check_sas(*wire.unpack_sas(sas))
+        if error_code is not None:
+            raise GroupError(error_code)
+        self.hasher.update(sas)
+
+    def complete(self):
+        if self.count is None or self.sas_bytes_left:
+            return False
+        return self.inner_type == GROUP_TOKEN_REQUEST or len(self.token) == TOKEN_SIZE
+
+    def group_token(self):
+        return self.hasher.hexdigest().encode('ascii')
+
+    def result(self):
+        # (response type, payload): the group token for type 5, the status for type 7
+        group_token = self.group_token()
+        if self.inner_type == GROUP_TOKEN_REQUEST:
+            return wire.GROUP_TOKEN_RESPONSE, group_token
+        status = 0 if bytes(self.token) == group_token else 1
+        return wire.GROUP_TOKEN_STATUS, wire.STATUS.pack(status)
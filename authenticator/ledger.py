@@ -0,0 +1,223 @@
+import mmap
+import os
+import struct
+import threading
+from itertools import chain
+
+import wire
+from wire import SAS_SIZE
+
+
+# FILE LAYOUT
+
+# The ledger is an array of fixed 80-byte records in a memory-mapped file.
+# Record 0 is the header. An issued individual token is one record holding
+# its SAS exactly as on the wire. An issued group token is a group record
+# followed by its N member SAS, contiguous, so a whole group compares with
+# one slice. IDs are ASCII, so a first byte of 0xff marks a group record.
+RECORD_SIZE = SAS_SIZE
+LEDGER_HEADER = struct.Struct('!8sQ64s')     # magic | records in use | key fingerprint
+GROUP_RECORD = struct.Struct('!B11xI64s')    # 0xff | N | group token
+MAGIC = b'AUTHLDG1'
+GROUP_MARKER = 0xff
+
+INITIAL_RECORDS = 4096          # records the file is created with, doubled when full
+MAX_RECORDS = 1 << 20           # compaction keeps the newest half when this is reached
+
+
+# LEDGER
+
+class TokenLedger:
+    # Append-only record of issued tokens that survives restarts. Lookups go
+    # through two dicts of record numbers, rebuilt by one scan on open:
+    # (stripped ID, nonce) -> SAS record and group token -> group record.
+    # A ledger written with another key (see `fingerprint`) is discarded.
+    # Appends land in the shared mapping, so they reach the file even if the
+    # process is killed; only a machine crash can lose the latest ones.
+    def __init__(self, path, fingerprint, max_records=MAX_RECORDS):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_records = max_records
+        self.lock = threading.Lock()
+        self.file = None
+        self.map = None
+        self.compactor = None       # background compaction thread, while one runs
+        self.open()
+
+    def open(self):
+        exists = os.path.exists(self.path)
+        self.map_file('r+b' if exists else 'w+b')
+        magic, count, fingerprint = LEDGER_HEADER.unpack_from(self.map)
+        if magic != MAGIC or fingerprint != self.fingerprint or count >= self.capacity():
+            count = 0
+        self.count = count
+        self.write_header()
+        self.build_index()
+
+    def map_file(self, mode):
+        self.file = open(self.path, mode)
+        if os.fstat(self.file.fileno()).st_size < RECORD_SIZE * INITIAL_RECORDS:
+            self.file.truncate(RECORD_SIZE * INITIAL_RECORDS)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    def close(self):
+        compactor = self.compactor
+        if compactor is not None:
+            compactor.join()
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+    def capacity(self):
+        return len(self.map) // RECORD_SIZE
+
+    def write_header(self):
+        LEDGER_HEADER.pack_into(self.map, 0, MAGIC, self.count, self.fingerprint)
+
+    def build_index(self):
+        self.tokens = {}
+        self.groups = {}
+        record = 1
+        while record <= self.count:
+            offset = record * RECORD_SIZE
+            if self.map[offset] == GROUP_MARKER:
+                _, size, token = GROUP_RECORD.unpack_from(self.map, offset)
+                if record + size > self.count:
+                    # Members cut off by a crash mid-append
+                    self.count = record - 1
+                    self.write_header()
+                    break
+                self.groups[token] = record
+                record += 1 + size
+            else:
+                student_id, nonce, _ = wire.unpack_sas(self.map, offset)
+                self.tokens[(student_id.strip(), nonce)] = record
+                record += 1
+
+    # LOOKUPS
+
+    def token(self, student_id, nonce):
+        # Issued token for the stripped ID and nonce, or None
+        with self.lock:
+            record = self.tokens.get((student_id, nonce))
+            if record is None:
+                return None
+            offset = record * RECORD_SIZE + RECORD_SIZE - wire.TOKEN_SIZE
+            return self.map[offset:offset + wire.TOKEN_SIZE]
+
+    def group_status(self, members, token):
+        # 0 if `token` was issued for exactly these member SAS, 1 if it was
+        # issued for others, None if it was never issued
+        with self.lock:
+            record = self.groups.get(bytes(token))
+            if record is None:
+                return None
+            size = GROUP_RECORD.unpack_from(self.map, record * RECORD_SIZE)[1]
+            start = (record + 1) * RECORD_SIZE
+            if size * RECORD_SIZE != len(members):
+                return 1
+            return 0 if self.map[start:start + size * RECORD_SIZE] == members else 1
+
+    # APPENDS
+
+    def add_token(self, student_id, nonce, token):
+        # `student_id` is the padded ID from the request
+        key = (student_id.strip(), nonce)
+        with self.lock:
+            if key in self.tokens:
+                return
+            record = self.reserve(1)
+            if record is None:
+                return
+            wire.SAS.pack_into(self.map, record * RECORD_SIZE, student_id, nonce, token)
+            self.tokens[key] = record
+            self.commit(1)
+
+    def add_group(self, members, token):
+        # `members` are the N SAS of a type 5 request, as received
+        size = len(members) // RECORD_SIZE
+        token = bytes(token)
+        with self.lock:
+            if token in self.groups:
+                return
+            record = self.reserve(1 + size)
+            if record is None:
+                return
+            offset = record * RECORD_SIZE
+            GROUP_RECORD.pack_into(self.map, offset, GROUP_MARKER, size, token)
+            self.map[offset + RECORD_SIZE:offset + (1 + size) * RECORD_SIZE] = members
+            self.groups[token] = record
+            self.commit(1 + size)
+
+    def reserve(self, size):
+        # First record of `size` free ones, growing the file if needed, or
+        # None if the entry is not recorded. A full ledger is compacted in the
+        # background, and entries offered meanwhile are dropped: the ledger
+        # only saves hashing, so a missing entry is recomputed when asked for.
+        if self.compactor is not None or 1 + size > self.max_records // 2:
+            return None
+        if 1 + self.count + size > self.max_records:
+            self.compactor = threading.Thread(target=self.compact, args=(self.max_records // 2,), daemon=True)
+            self.compactor.start()
+            return None
+        if 1 + self.count + size > self.capacity():
+            self.grow(1 + self.count + size)
+        return 1 + self.count
+
+    def commit(self, size):
+        # The header is updated last, so a torn append is never indexed
+        self.count += size
+        self.write_header()
+
+    def grow(self, needed):
+        records = self.capacity()
+        while records < needed:
+            records *= 2
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(min(records, self.max_records) * RECORD_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    # COMPACTION
+
+    def compact(self, keep=None):
+        # Rewrites the ledger with only the newest entries that fit in `keep`
+        # records (all of them by default) and swaps it in atomically.
+        # Entries tile the records, so the kept ones are one contiguous tail,
+        # copied in one slice. Only the swap holds the lock: lookups go on
+        # while the tail is written, and appends are dropped until it ends.
+        with self.lock:
+            count = self.count
+            keep = count if keep is None else keep
+            # Entries never change while nothing is appended, so they can be
+            # read without the lock from here on
+            self.compactor = self.compactor or threading.current_thread()
+        first = min((record for record in chain(self.tokens.values(), self.groups.values())
+                     if record > count - keep), default=count + 1)
+        used = count + 1 - first
+
+        records = max(INITIAL_RECORDS, 1 + used)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w+b') as temp:
+            temp.truncate(records * RECORD_SIZE)
+            temp.write(LEDGER_HEADER.pack(MAGIC, used, self.fingerprint).ljust(RECORD_SIZE, b'\0'))
+            temp.write(self.map[first * RECORD_SIZE:(count + 1) * RECORD_SIZE])
+            temp.flush()
+            os.fsync(temp.fileno())
+        shift = first - 1
+        tokens = {key: record - shift for key, record in self.tokens.items() if record >= first}
+        groups = {token: record - shift for token, record in self.groups.items() if record >= first}
+
+        with self.lock:
+            self.map.close()
+            self.file.close()
+            os.replace(temp_path, self.path)
+            self.map_file('r+b')
+            self.count = used
+            self.tokens = tokens
+            self.groups = groups
+            self.compactor = None
+
+    def stats(self):
+        return {"records": self.count, "tokens": len(self.tokens), "groups": len(self.groups)}
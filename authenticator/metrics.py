@@ -0,0 +1,211 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# Messages a client sends, by type; any other type is counted as "other" so
+# senders can't create a label per 16-bit value
+MESSAGE_NAMES = {
+    1: "itr",
+    3: "itv",
+    5: "gtr",
+    7: "gtv",
+    9: "fragment",
+}
+
+ERROR_NAMES = {
+    1: "INVALID_MESSAGE_CODE",
+    2: "INCORRECT_MESSAGE_LENGTH",
+    3: "INVALID_PARAMETER",
+    4: "INVALID_SINGLE_TOKEN",
+    5: "ASCII_DECODE_ERROR",
+}
+
+# Upper bounds in seconds, from 1 us to about 1 s
+LATENCY_BUCKETS = [1e-6 * 2 ** i for i in range(21)]
+STAGES = ('parse', 'hash', 'send')
+
+
+# HISTOGRAMS AND COUNTERS
+
+def copy_counts(counter):
+    # The serving threads may add a key while the stats thread copies, which
+    # raises RuntimeError; retrying keeps locks off the hot path
+    while True:
+        try:
+            return dict(counter)
+        except RuntimeError:
+            pass
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.messages = Counter()
+        self.errors = Counter()
+        self.dropped = Counter()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.extra = {}
+
+    def count_message(self, message_type):
+        self.messages[MESSAGE_NAMES.get(message_type, "other")] += 1
+
+    def count_reply(self, response):
+        # Error replies are 256 | code
+        if response is not None and len(response) == 4 and response[0] == 1 and response[1] == 0:
+            self.errors[response[3]] += 1
+
+    def count_drop(self, reason):
+        self.dropped[reason] += 1
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def add_source(self, name, stats):
+        # `stats` is a callable returning a dict of numbers, e.g. cache counters
+        self.extra[name] = stats
+
+    def snapshot(self):
+        errors = copy_counts(self.errors)
+        return {
+            "uptime": time.time() - self.started,
+            "messages": dict(sorted(copy_counts(self.messages).items())),
+            "errors": {ERROR_NAMES.get(code, str(code)): n for code, n in sorted(errors.items())},
+            "dropped": dict(sorted(copy_counts(self.dropped).items())),
+            "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+            **{name: stats() for name, stats in self.extra.items()},
+        }
+
+    def prometheus(self):
+        messages, errors = copy_counts(self.messages), copy_counts(self.errors)
+        lines = ["# TYPE auth_messages_total counter"]
+        for message_type, n in sorted(messages.items()):
+            lines.append(f'auth_messages_total{{type="{message_type}"}} {n}')
+        lines.append("# TYPE auth_errors_total counter")
+        for code, name in ERROR_NAMES.items():
+            lines.append(f'auth_errors_total{{code="{code}",name="{name}"}} {errors.get(code, 0)}')
+        lines.append("# TYPE auth_dropped_total counter")
+        for reason, n in sorted(copy_counts(self.dropped).items()):
+            lines.append(f'auth_dropped_total{{reason="{reason}"}} {n}')
+        lines.append("# TYPE auth_stage_seconds histogram")
+        for stage, histogram in self.stages.items():
+            snapshot = histogram.snapshot()
+            for bound, total in snapshot["buckets"]:
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'auth_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {total}')
+            lines.append(f'auth_stage_seconds_sum{{stage="{stage}"}} {snapshot["sum"]}')
+            lines.append(f'auth_stage_seconds_count{{stage="{stage}"}} {snapshot["count"]}')
+        for name, stats in self.extra.items():
+            for key, value in stats().items():
+                lines.append(f"auth_{name}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# SAMPLING PROFILER
+
+class Sampler:
+    # Samples the innermost frame of every other thread at a fixed interval.
+    # Cheap enough to switch on under load and off again at runtime.
+    def __init__(self):
+        self.samples = Counter()
+        self.thread = None
+        self.running = threading.Event()
+
+    def start(self, interval=0.005):
+        if self.thread is not None:
+            return
+        self.samples.clear()
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self, interval):
+        own = threading.get_ident()
+        while self.running.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    code = frame.f_code
+                    self.samples[f"{code.co_filename}:{frame.f_lineno} {code.co_name}"] += 1
+            time.sleep(interval)
+
+    def top(self, n=25):
+        total = sum(self.samples.values())
+        return {"running": self.thread is not None, "samples": total,
+                "top": [{"frame": frame, "samples": count} for frame, count in self.samples.most_common(n)]}
+
+
+# STATS ENDPOINT
+
+class StatsHandler(BaseHTTPRequestHandler):
+    # GET /metrics          Prometheus text
+    # GET /stats            JSON snapshot
+    # GET /profile          sampler results
+    # GET /profile/start    start sampling (?interval=seconds)
+    # GET /profile/stop     stop sampling
+    def do_GET(self):
+        url = urlparse(self.path)
+        metrics, sampler = self.server.metrics, self.server.sampler
+        if url.path == '/metrics':
+            self.reply(metrics.prometheus(), 'text/plain; version=0.0.4')
+        elif url.path == '/stats':
+            self.reply(json.dumps(metrics.snapshot()), 'application/json')
+        elif url.path == '/profile/start':
+            interval = float(parse_qs(url.query).get('interval', ['0.005'])[0])
+            sampler.start(interval)
+            self.reply(json.dumps(sampler.top()), 'application/json')
+        elif url.path == '/profile/stop':
+            sampler.stop()
+            self.reply(json.dumps(sampler.top()), 'application/json')
+        elif url.path == '/profile':
+            self.reply(json.dumps(sampler.top()), 'application/json')
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stats_server(metrics, host, port):
+    server = ThreadingHTTPServer((host, port), StatsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    server.sampler = Sampler()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
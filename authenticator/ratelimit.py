@@ -0,0 +1,37 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# TOKEN BUCKET PER CLIENT
+
+class RateLimiter:
+    # One token bucket per key, refilled at `rate` tokens per second up to
+    # `burst`. At most `max_clients` buckets are kept, evicting the least
+    # recently seen client, so a flood of spoofed sources can't grow memory.
+    def __init__(self, rate, burst=None, max_clients=65536):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()    # key -> [tokens, last refill]
+        self.lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self.buckets.popitem(last=False)
+                bucket = self.buckets[key] = [self.burst, now]
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < cost:
+                return False
+            bucket[0] -= cost
+            return True
+
+    def stats(self):
+        return {"clients": len(self.buckets)}
@@ -0,0 +1,61 @@
+import socket
+import time
+
+
+# RETRANSMISSION TIMEOUT
+
+# Same estimator as TCP (RFC 6298): SRTT and RTTVAR are updated from every
+# reply to a request that was sent only once (Karn's algorithm), and each
+# retransmission doubles the timeout up to MAX_RTO
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 10.0
+MAX_RETRIES = 5
+CLOCK_GRANULARITY = 0.001
+
+class RetransmissionTimer:
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO, max_retries=MAX_RETRIES):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.max_retries = max_retries
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+    def observe(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        rto = self.srtt + max(CLOCK_GRANULARITY, 4 * self.rttvar)
+        self.rto = min(max(rto, self.min_rto), self.max_rto)
+
+    def timeout(self, attempt):
+        return min(self.rto * 2 ** attempt, self.max_rto)
+
+
+# REQUEST / RESPONSE
+
+def request(sock, message, address, is_reply, timer, recv_size=65535):
+    # Sends `message` and returns the first datagram `is_reply` accepts,
+    # resending on timeout. Raises socket.timeout after timer.max_retries.
+    for attempt in range(timer.max_retries + 1):
+        sent_at = time.monotonic()
+        sock.sendto(message, address)
+        deadline = sent_at + timer.timeout(attempt)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(recv_size)
+            except socket.timeout:
+                break
+            if is_reply(data):
+                if attempt == 0:
+                    timer.observe(time.monotonic() - sent_at)
+                return data
+    raise socket.timeout(f"no reply after {timer.max_retries + 1} attempts")
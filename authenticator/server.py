@@ -1,161 +1,544 @@
 import socket
-import struct
-import hashlib
+import argparse
+import asyncio
+import multiprocessing
+import os
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import udp
+import wire
+from cache import TokenCache
+from fragments import Reassembler
+from ledger import MAX_RECORDS as MAX_LEDGER_RECORDS, TokenLedger
+from grouphash import GroupError, GroupStream
+from metrics import Metrics, start_stats_server
+from ratelimit import RateLimiter
+from tokens import load_secret, token_hasher
+from wire import (INCORRECT_MESSAGE_LENGTH, INVALID_PARAMETER,
+                  INVALID_SINGLE_TOKEN, ASCII_DECODE_ERROR, SAS_SIZE, TOKEN_SIZE, error_message)
+
+SERVER_HOST = 'localhost'
+SERVER_PORT = 51001
+STATS_HOST = 'localhost'
+RECV_BUFFER_SIZE = 65535
+
+# Fixed-size responses are packed into these buffers, so a response must be
+# sent (or copied) before the next datagram is dispatched
+itr_response = bytearray(wire.ITR_RESPONSE.size)
+itv_response = bytearray(wire.ITV_RESPONSE_SIZE)
+
+# METRICS
+
+metrics = Metrics()
+# Seconds spent hashing by the current thread, so dispatch can tell parse
+# time apart from hash time
+hash_clock = threading.local()
+
+def hash_seconds():
+    return getattr(hash_clock, 'total', 0.0)
+
+def record_hash(started):
+    elapsed = time.perf_counter() - started
+    hash_clock.total = hash_seconds() + elapsed
+    metrics.observe('hash', elapsed)
 
-# ERROR CODES
-INVALID_MESSAGE_CODE = 1
-INCORRECT_MESSAGE_LENGTH = 2
-INVALID_PARAMETER = 3
-INVALID_SINGLE_TOKEN = 4
-ASCII_DECODE_ERROR = 5
 
 # TOKEN GENERATION
 
+# Every token is hashed with a copy of this, so with a secret the HMAC key
+# schedule is computed once per worker instead of once per token
+base_hasher = token_hasher()
+
+def set_secret(secret):
+    global base_hasher
+    base_hasher = token_hasher(secret)
+
 def generate_token(data):
-    return hashlib.sha256(data).hexdigest()
+    started = time.perf_counter()
+    hasher = base_hasher.copy()
+    hasher.update(data)
+    token = hasher.hexdigest()
+    record_hash(started)
+    return token
+
+def new_group_hasher():
+    return base_hasher.copy()
+
+def group_token(sas_bytes):
+    started = time.perf_counter()
+    hasher = new_group_hasher()
+    hasher.update(sas_bytes)
+    token = hasher.hexdigest().encode('ascii')
+    record_hash(started)
+    return token
+
+
+# TOKEN CACHE
+
+# Shared by every handler, keyed on (student_id, nonce) so retransmits and
+# SAS repeated across group requests skip the hashing
+token_cache = TokenCache()
+metrics.add_source('token_cache', lambda: token_cache.stats())
+
+# Optional record of issued tokens on disk, set up by configure(). Tokens
+# found there are trusted without hashing, also after a restart.
+ledger = None
+
+def individual_token(student_id, nonce):
+    key = (student_id, nonce)
+    token = token_cache.get(key)
+    if token is None:
+        if ledger is not None:
+            token = ledger.token(student_id, nonce)
+        if token is None:
+            token = generate_token(student_id + b'%d' % nonce).encode('ascii')
+        token_cache.put(key, token)
+    return token
 
 
 # INDIVIDUAL TOKENS
 
 
-def handle_individual_token_request(data, client_address):
+def handle_individual_token_request(data):
     if len(data) != 16:
-        send_error(client_address, INCORRECT_MESSAGE_LENGTH)
-        return
-    try:
-        # Get student id and nonce from client data package
-        student_id = data[:12].decode('ascii').strip()
-        nonce = struct.unpack('!I', data[12:16])[0]
-    except UnicodeDecodeError:
-        send_error(client_address, ASCII_DECODE_ERROR)
-        return
-    except struct.error:
-        send_error(client_address, INVALID_PARAMETER)
-        return
-    
+        return error_message(INCORRECT_MESSAGE_LENGTH)
+    # Get student id and nonce from client data package
+    student_id, nonce = wire.ID_NONCE.unpack_from(data)
+    if not student_id.isascii():
+        return error_message(ASCII_DECODE_ERROR)
+
     # Generate token
-    token = generate_token((student_id + str(nonce)).encode('ascii'))
+    token = individual_token(student_id.strip(), nonce)
+    if ledger is not None:
+        ledger.add_token(student_id, nonce, token)
     # Response: 2     | ID            | nonce         | token            
-    response = struct.pack('!H', 2) + data[:16] + token.encode('ascii')
-    server_socket.sendto(response, client_address)
+    wire.ITR_RESPONSE.pack_into(itr_response, 0, wire.INDIVIDUAL_TOKEN_RESPONSE, student_id, nonce, token)
+    return itr_response
 
 
-def handle_individual_token_validation(data, client_address):
+def handle_individual_token_validation(data):
     if len(data) != 80:
-        send_error(client_address, INCORRECT_MESSAGE_LENGTH)
-        return
-    
-    try:
-        # Get student id, nonce and token from client data package
-        student_id = data[:12].decode('ascii').strip()
-        nonce = struct.unpack('!I', data[12:16])[0]
-        token = data[16:].decode('ascii')
-    except UnicodeDecodeError:
-        send_error(client_address, ASCII_DECODE_ERROR)
-        return
-    except struct.error:
-        send_error(client_address, INVALID_PARAMETER)
-        return
-    
+        return error_message(INCORRECT_MESSAGE_LENGTH)
+    # Get student id, nonce and token from client data package
+    student_id, nonce, token = wire.unpack_sas(data)
+    if not (student_id.isascii() and token.isascii()):
+        return error_message(ASCII_DECODE_ERROR)
+
     # Validate token
-    if token == generate_token((student_id + str(nonce)).encode('ascii')):
+    if token == individual_token(student_id.strip(), nonce):
         status = 0
     else:
         status = 1
     
     # Response: 4     | ID            | nonce         | token               | s 
-    response = struct.pack('!H', 4) + data + struct.pack('B', status)
-    server_socket.sendto(response, client_address)
+    wire.HEADER.pack_into(itv_response, 0, wire.INDIVIDUAL_TOKEN_STATUS)
+    itv_response[2:82] = data
+    itv_response[82] = status
+    return itv_response
 
 
-# GROUP TOKENS
+# GROUP VERIFICATION
 
+# Groups with fewer SAS than this are verified inline, larger ones are split
+# into chunks that the verify pool checks concurrently
+PARALLEL_GROUP_THRESHOLD = 64
+GROUP_CHUNK_SIZE = 128
 
-def handle_group_token_request(data, client_address):
-    try:
-        count = struct.unpack('!H', data[:2])[0]
-        if count <= 0 or count * 80 + 2 != len(data):
-            send_error(client_address, INVALID_PARAMETER)
-            return
-    except struct.error:
-        send_error(client_address, INVALID_PARAMETER)
-        return
-    
-    if len(data) != 2 + 80 * count:
-        send_error(client_address, INCORRECT_MESSAGE_LENGTH)
-        return
-    
-    group_token = generate_token(data[2:])
-    response = struct.pack('!H', 6) + struct.pack('!H', count) + data[2:] + group_token.encode('ascii')
-    
-    sas_list = [data[i:i+80] for i in range(2, len(data), 80)]
-    for sas in sas_list:
+# Per-SAS hashes are too small for hashlib to release the GIL, so the pool
+# only pays off on interpreters without one and is off by default
+verify_threads = 1
+verify_pool = None
+
+def get_verify_pool():
+    # Created on first use so every worker process gets its own threads
+    global verify_pool
+    if verify_pool is None:
+        verify_pool = ThreadPoolExecutor(max_workers=verify_threads)
+    return verify_pool
+
+def check_sas(student_id, nonce, token):
+    if not (student_id.isascii() and token.isascii()):
+        return ASCII_DECODE_ERROR
+    if token != individual_token(student_id.strip(), nonce):
+        return INVALID_SINGLE_TOKEN
+    return None
+
+def verify_sas_range(data, first, last, failed=None):
+    for offset in range(2 + first * SAS_SIZE, 2 + last * SAS_SIZE, SAS_SIZE):
+        if failed is not None and failed.is_set():
+            return None
+        error_code = check_sas(*wire.unpack_sas(data, offset))
+        if error_code is not None:
+            if failed is not None:
+                failed.set()
+            return error_code
+    return None
+
+def verify_group(data, count):
+    # Returns (error code, None) at the first bad SAS, else (None, group token)
+    if count < PARALLEL_GROUP_THRESHOLD or verify_threads <= 1:
+        # One pass: each SAS is hashed into the group token right after it is checked
+        stream = GroupStream(wire.GROUP_TOKEN_REQUEST, check_sas, new_group_hasher())
         try:
-            student_id = sas[:12].decode('ascii').strip()
-            nonce = struct.unpack('!I', sas[12:16])[0]
-            token = sas[16:].decode('ascii')
-        except UnicodeDecodeError:
-            send_error(client_address, ASCII_DECODE_ERROR)
-            return
-        except struct.error:
-            send_error(client_address, INVALID_PARAMETER)
-            return
-        
-        if token != generate_token((student_id + str(nonce)).encode('ascii')):
-            send_error(client_address, INVALID_SINGLE_TOKEN)
-            break
+            stream.feed(data)
+        except GroupError as e:
+            return e.error_code, None
+        return None, stream.group_token()
+
+    # hashlib only releases the GIL for buffers over 2 KiB, which the group
+    # token always is, so it is hashed in the pool while the SAS are checked
+    pool = get_verify_pool()
+    failed = threading.Event()
+    group_future = pool.submit(group_token, data[2:])
+    futures = [pool.submit(verify_sas_range, data, first, min(first + GROUP_CHUNK_SIZE, count), failed)
+               for first in range(0, count, GROUP_CHUNK_SIZE)]
+    for future in as_completed(futures):
+        error_code = future.result()
+        if error_code is not None:
+            for pending in futures:
+                pending.cancel()
+            group_future.cancel()
+            return error_code, None
+    return None, group_future.result()
+
+
+# GROUP TOKENS
 
+
+def handle_group_token_request(data):
+    if len(data) < 2:
+        return error_message(INVALID_PARAMETER)
+    count = wire.group_count(data)
+    if count <= 0 or count > wire.MAX_GROUP_SIZE or count * SAS_SIZE + 2 != len(data):
+        return error_message(INVALID_PARAMETER)
+
+    error_code, token = verify_group(data, count)
+    if error_code is not None:
+        return error_message(error_code)
+    if ledger is not None:
+        ledger.add_group(data[2:], token)
     # Response: 6     | N     | SAS-1    | SAS-2     | SAS-N     | token 
-    server_socket.sendto(response, client_address)
+    response = bytearray(2 + len(data) + TOKEN_SIZE)
+    wire.HEADER.pack_into(response, 0, wire.GROUP_TOKEN_RESPONSE)
+    response[2:2 + len(data)] = data
+    response[2 + len(data):] = token
+    return response
 
 
-def handle_group_token_validation(data, client_address):
+def handle_group_token_validation(data):
     if len(data) < 144:
-        send_error(client_address, INCORRECT_MESSAGE_LENGTH)
-        return
-    try:
-        token = data[-64:].decode('ascii')
-    except UnicodeDecodeError:
-            send_error(client_address, ASCII_DECODE_ERROR)
-            return
-    
+        return error_message(INCORRECT_MESSAGE_LENGTH)
+
+    # A group issued by this server is confirmed against the ledger without
+    # rehashing its SAS
+    status = None
+    if ledger is not None and wire.group_count(data) * SAS_SIZE + 2 + TOKEN_SIZE == len(data):
+        status = ledger.group_status(data[2:-TOKEN_SIZE], data[-TOKEN_SIZE:])
+
     # Validate token
-    correct_token = generate_token(data[2:-64])
-    status = 1
-    if token == correct_token:
-        status = 0
+    if status is None:
+        stream = GroupStream(wire.GROUP_TOKEN_VALIDATION, None, new_group_hasher())
+        try:
+            stream.feed(data)
+        except GroupError as e:
+            return error_message(e.error_code)
+        if not stream.complete():
+            return error_message(INCORRECT_MESSAGE_LENGTH)
+        if not stream.token.isascii():
+            return error_message(ASCII_DECODE_ERROR)
+        status = 0 if stream.token == stream.group_token() else 1
     # Response: 8     | N     | SAA-1     | SAA-2     | SAA-N     | token   | s 
-    response = struct.pack('!H', 8) + data[2:] + struct.pack('B', status)
-    server_socket.sendto(response, client_address)
+    response = bytearray(2 + len(data) + 1)
+    wire.HEADER.pack_into(response, 0, wire.GROUP_TOKEN_STATUS)
+    response[2:-1] = data
+    response[-1] = status
+    return response
 
 
-# ERROR HANDLING
-    
-def send_error(client_address, error_code):
-    error_msg = struct.pack('!HH', 256, error_code)
-    server_socket.sendto(error_msg, client_address)
+# FRAGMENTED GROUP MESSAGES
+
+# Types 5 and 7 too large for one datagram arrive as type 9 fragments and are
+# verified and hashed as they stream in
+reassembler = Reassembler(check_sas, new_group_hasher)
+
+
+# ADMISSION
+
+# Per-client token buckets keyed by source IP, set up by configure(). With
+# `rate_limiter` datagrams over the limit are dropped without a reply; with
+# `error_limiter` malformed datagrams get at most that many error replies and
+# the rest are dropped, so spoofed garbage can't be reflected at full rate.
+rate_limiter = None
+error_limiter = None
+
+
+# DISPATCH
+
+HANDLERS = {
+    1: handle_individual_token_request,
+    3: handle_individual_token_validation,
+    5: handle_group_token_request,
+    7: handle_group_token_validation,
+}
+
+def dispatch(data, client_address=None):
+    # Returns the reply for one datagram, or None if nothing should be sent.
+    # Hashing inside the incremental group hasher is counted as parse time.
+    started = time.perf_counter()
+    hashed = hash_seconds()
+    response = route(data, client_address)
+    metrics.observe('parse', time.perf_counter() - started - (hash_seconds() - hashed))
+    metrics.count_reply(response)
+    return response
+
+def route(data, client_address):
+    client = client_address[0] if client_address is not None else None
+    if rate_limiter is not None and client is not None and not rate_limiter.allow(client):
+        metrics.count_drop('rate')
+        return None
+    if len(data) >= 2:
+        metrics.count_message(wire.message_type(data))
+
+    # Lengths no handler could accept are rejected before any parsing
+    error_code = wire.frame_error(data)
+    if error_code is not None:
+        if error_limiter is not None and client is not None and not error_limiter.allow(client):
+            metrics.count_drop('malformed')
+            return None
+        return error_message(error_code)
+
+    msg_type = wire.message_type(data)
+    if msg_type == wire.FRAGMENT:
+        return reassembler.handle(memoryview(data), client_address)
+    return HANDLERS[msg_type](memoryview(data)[2:])
 
 # SERVER LOGIC
-def serve():
+
+def create_socket(host=SERVER_HOST, port=SERVER_PORT, reuse_port=False):
+    # IPv4 or IPv6 depending on `host`, dual-stack for '::' (see udp.resolve)
+    return udp.server_socket(host, port, reuse_port)
+
+def serve(sock=None):
     global server_socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_socket.bind(('localhost', 51001))
-    
-    print("Server started.")
+    server_socket = sock if sock is not None else create_socket()
 
     while True:
-        data, client_address = server_socket.recvfrom(1024)
-        msg_type = struct.unpack('!H', data[:2])[0]
-        if msg_type == 1:
-            handle_individual_token_request(data[2:], client_address)
-        elif msg_type == 3:
-            handle_individual_token_validation(data[2:], client_address)
-        elif msg_type == 5:
-            handle_group_token_request(data[2:], client_address)
-        elif msg_type == 7:
-            handle_group_token_validation(data[2:], client_address)
+        data, client_address = server_socket.recvfrom(RECV_BUFFER_SIZE)
+        response = dispatch(data, client_address)
+        if response is not None:
+            send_reply(response, client_address)
+
+def send_reply(response, client_address):
+    started = time.perf_counter()
+    server_socket.sendto(response, client_address)
+    metrics.observe('send', time.perf_counter() - started)
+
+
+# BATCHED SERVER
+
+BATCH_SIZE = 64
+
+def serve_batched(sock=None):
+    global server_socket
+    server_socket = sock if sock is not None else create_socket()
+    server_socket.setblocking(False)
+    views = [memoryview(bytearray(RECV_BUFFER_SIZE)) for _ in range(BATCH_SIZE)]
+
+    while True:
+        # Wait until at least one datagram is ready, then drain every ready
+        # datagram into the preallocated buffers before handling any of them
+        select.select([server_socket], [], [])
+        batch = []
+        for view in views:
+            try:
+                nbytes, client_address = server_socket.recvfrom_into(view)
+            except BlockingIOError:
+                break
+            batch.append((view[:nbytes], client_address))
+
+        # Copy each response out of the shared buffers before the next dispatch
+        replies = []
+        for data, client_address in batch:
+            response = dispatch(data, client_address)
+            if response is not None:
+                replies.append((bytes(response), client_address))
+        flush_replies(replies)
+
+def flush_replies(replies):
+    for response, client_address in replies:
+        while True:
+            try:
+                send_reply(response, client_address)
+                break
+            except BlockingIOError:
+                select.select([], [server_socket], [])
+
+
+# ASYNCIO SERVER
+
+# Group messages with more SAS than this are handled in the executor so they
+# don't hold up the event loop for small requests
+GROUP_OFFLOAD_THRESHOLD = 4
+
+def is_large_group(data):
+    if len(data) < 4 or wire.message_type(data) not in (wire.GROUP_TOKEN_REQUEST, wire.GROUP_TOKEN_VALIDATION):
+        return False
+    return wire.group_count(data, 2) > GROUP_OFFLOAD_THRESHOLD
+
+class AuthenticatorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.transport = None
+        self.pending = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, client_address):
+        if is_large_group(data):
+            task = asyncio.ensure_future(self.dispatch_in_executor(data, client_address))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
         else:
-           send_error(client_address, INVALID_MESSAGE_CODE)
+            response = dispatch(data, client_address)
+            if response is not None:
+                self.send_reply(response, client_address)
+
+    def send_reply(self, response, client_address):
+        started = time.perf_counter()
+        self.transport.sendto(response, client_address)
+        metrics.observe('send', time.perf_counter() - started)
+
+    async def dispatch_in_executor(self, data, client_address):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.executor, dispatch, data, client_address)
+        if response is not None and not self.transport.is_closing():
+            self.send_reply(response, client_address)
+
+async def start_async_server(sock=None, executor=None):
+    # Returns (transport, protocol) so the server can run next to other coroutines
+    loop = asyncio.get_running_loop()
+    if sock is None:
+        sock = create_socket()
+    return await loop.create_datagram_endpoint(lambda: AuthenticatorProtocol(executor), sock=sock)
+
+async def serve_async(sock=None):
+    transport, _ = await start_async_server(sock)
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        transport.close()
+
+
+# MULTI-WORKER SERVER
+
+def configure(options, worker=0):
+    global token_cache, verify_threads, rate_limiter, error_limiter, ledger
+    set_secret(load_secret(options.secret_file))
+    token_cache = TokenCache(options.cache_size, options.cache_ttl)
+    if options.ledger:
+        # Workers don't share a ledger, each appends to its own file. The
+        # fingerprint is a token only the current key produces.
+        path = options.ledger if options.workers == 1 else f"{options.ledger}.{worker}"
+        ledger = TokenLedger(path, generate_token(b'ledger').encode('ascii'), options.ledger_max_records)
+        metrics.add_source('ledger', ledger.stats)
+    verify_threads = options.verify_threads
+    if options.rate:
+        rate_limiter = RateLimiter(options.rate, options.burst, options.max_clients)
+        metrics.add_source('rate_limiter', rate_limiter.stats)
+    if options.error_rate:
+        error_limiter = RateLimiter(options.error_rate, max_clients=options.max_clients)
+    if options.stats_port:
+        # One stats endpoint per worker, on consecutive ports
+        start_stats_server(metrics, STATS_HOST, options.stats_port + worker)
+
+def run(sock=None, options=None, worker=0):
+    if options is not None:
+        configure(options, worker)
+        if sock is None:
+            sock = create_socket(options.host, options.port)
+    backend = options.backend if options is not None else 'socket'
+    if backend == 'asyncio':
+        asyncio.run(serve_async(sock))
+    elif backend == 'batch':
+        serve_batched(sock)
+    else:
+        serve(sock)
+
+def serve_reuse_port(options, worker):
+    run(create_socket(options.host, options.port, reuse_port=True), options, worker)
+
+def serve_workers(options):
+    # With SO_REUSEPORT every worker binds its own socket and the kernel
+    # spreads datagrams between them. Otherwise all workers share one socket.
+    if hasattr(socket, 'SO_REUSEPORT'):
+        processes = [multiprocessing.Process(target=serve_reuse_port, args=(options, worker))
+                     for worker in range(options.workers)]
+    else:
+        sock = create_socket(options.host, options.port)
+        processes = [multiprocessing.Process(target=run, args=(sock, options, worker))
+                     for worker in range(options.workers)]
+
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authenticator server")
+    parser.add_argument('--host', default=SERVER_HOST,
+                        help=f"address to bind, '::' for every IPv4 and IPv6 address (default: {SERVER_HOST})")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help=f"UDP port (default: {SERVER_PORT})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('--backend', choices=['socket', 'batch', 'asyncio'], default='socket',
+                        help="blocking socket loop, batched non-blocking loop or asyncio "
+                             "DatagramProtocol (default: socket)")
+    parser.add_argument('--cache-size', type=int, default=65536,
+                        help="maximum cached individual tokens per worker, 0 disables (default: 65536)")
+    parser.add_argument('--cache-ttl', type=float, default=None,
+                        help="seconds a cached token stays valid (default: no expiry)")
+    parser.add_argument('--verify-threads', type=int, default=verify_threads,
+                        help="threads used to verify large groups, 1 verifies inline (default: 1)")
+    parser.add_argument('--secret-file', default=None,
+                        help="derive tokens with HMAC-SHA256 keyed by this file's contents; without it "
+                             "$AUTH_SECRET is used if set, else tokens are plain SHA-256")
+    parser.add_argument('--ledger', default=None,
+                        help="keep issued tokens in this memory-mapped file (one per worker, suffixed "
+                             "with the worker number) and trust them on validation and restart")
+    parser.add_argument('--ledger-max-records', type=int, default=MAX_LEDGER_RECORDS,
+                        help=f"80-byte records before the ledger is compacted to its newest half "
+                             f"(default: {MAX_LEDGER_RECORDS})")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="datagrams per second accepted from each client IP, the rest are "
+                             "dropped (default: no limit)")
+    parser.add_argument('--burst', type=float, default=None,
+                        help="datagrams a client IP may send at once above --rate (default: --rate)")
+    parser.add_argument('--error-rate', type=float, default=None,
+                        help="error replies per second sent to each client IP for malformed "
+                             "datagrams, the rest are dropped (default: no limit)")
+    parser.add_argument('--max-clients', type=int, default=65536,
+                        help="client IPs tracked by the limiters, least recent evicted (default: 65536)")
+    parser.add_argument('--stats-port', type=int, default=None,
+                        help="serve /metrics (Prometheus), /stats (JSON) and /profile over HTTP on "
+                             "this port, plus one port per extra worker")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    print(f"Server started with {args.workers} worker(s).")
+    if args.workers == 1:
+        run(options=args)
+    else:
+        serve_workers(args)
 
 if __name__ == "__main__":
-    serve()
+    main()
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import unittest
+
+import wire
+from wire import ASCII_DECODE_ERROR, INCORRECT_MESSAGE_LENGTH, INVALID_MESSAGE_CODE, INVALID_PARAMETER
+
+
+# The bridge defense game has a server module too, so this one is loaded by
+# path under its own name
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+spec = importlib.util.spec_from_file_location('auth_server', SERVER_PATH)
+server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(server)
+
+SAS = wire.SAS.pack(b'2016006492'.ljust(wire.ID_SIZE), 1, b'0' * wire.TOKEN_SIZE)
+TOKEN = b'1' * wire.TOKEN_SIZE
+
+# (name, datagram, error code frame_error gives)
+FRAMES = [
+    ("empty", b'', INCORRECT_MESSAGE_LENGTH),
+    ("type only", b'\x00', INCORRECT_MESSAGE_LENGTH),
+    ("unknown type", wire.HEADER.pack(99) + b'x' * 16, INVALID_MESSAGE_CODE),
+    ("response type", wire.HEADER.pack(wire.INDIVIDUAL_TOKEN_RESPONSE) + SAS, INVALID_MESSAGE_CODE),
+    ("itr", wire.individual_token_request('2016006492', 1), None),
+    ("itr short", wire.individual_token_request('2016006492', 1)[:-1], INCORRECT_MESSAGE_LENGTH),
+    ("itr long", wire.individual_token_request('2016006492', 1) + b'\0', INCORRECT_MESSAGE_LENGTH),
+    ("itv", wire.individual_token_validation(SAS), None),
+    ("itv short", wire.individual_token_validation(SAS)[:-1], INCORRECT_MESSAGE_LENGTH),
+    ("itv long", wire.individual_token_validation(SAS) + b'\0', INCORRECT_MESSAGE_LENGTH),
+    ("gtr", wire.group_token_request([SAS, SAS]), None),
+    ("gtr no count", wire.HEADER.pack(wire.GROUP_TOKEN_REQUEST), INVALID_PARAMETER),
+    ("gtr partial count", wire.HEADER.pack(wire.GROUP_TOKEN_REQUEST) + b'\0', INVALID_PARAMETER),
+    ("gtr partial SAS", wire.group_token_request([SAS])[:-1], INVALID_PARAMETER),
+    ("gtv", wire.group_token_validation([SAS], TOKEN), None),
+    ("gtv no SAS", wire.group_token_validation([], TOKEN), INCORRECT_MESSAGE_LENGTH),
+    ("gtv short token", wire.group_token_validation([SAS], TOKEN)[:-1], INCORRECT_MESSAGE_LENGTH),
+    ("gtv long", wire.group_token_validation([SAS], TOKEN) + b'\0', INCORRECT_MESSAGE_LENGTH),
+    ("fragment header only", wire.FRAGMENT_HEADER.pack(wire.FRAGMENT, 5, 1, 0, 1), None),
+    ("fragment short", wire.FRAGMENT_HEADER.pack(wire.FRAGMENT, 5, 1, 0, 1)[:-1], INCORRECT_MESSAGE_LENGTH),
+]
+
+
+class FrameErrorTest(unittest.TestCase):
+    def test_table(self):
+        for name, data, expected in FRAMES:
+            with self.subTest(name):
+                self.assertEqual(wire.frame_error(data), expected)
+
+    def test_handlers_agree(self):
+        # A length frame_error rejects is rejected the same way by the
+        # handler, had the datagram got that far
+        for name, data, expected in FRAMES:
+            if expected is None or len(data) < 2 or wire.message_type(data) not in server.HANDLERS:
+                continue
+            with self.subTest(name):
+                reply = server.HANDLERS[wire.message_type(data)](memoryview(data)[2:])
+                self.assertEqual(wire.error_code(reply), expected)
+
+    def test_accepted_lengths_pass_handlers(self):
+        # ...and the lengths it lets through aren't length errors there
+        for name, data, expected in FRAMES:
+            if expected is not None or wire.message_type(data) not in server.HANDLERS:
+                continue
+            with self.subTest(name):
+                reply = server.HANDLERS[wire.message_type(data)](memoryview(data)[2:])
+                if wire.message_type(reply) == wire.ERROR:
+                    self.assertNotIn(wire.error_code(reply), (INCORRECT_MESSAGE_LENGTH, INVALID_PARAMETER))
+
+    def test_route_uses_frame_error(self):
+        for name, data, expected in FRAMES:
+            if expected is None:
+                continue
+            with self.subTest(name):
+                self.assertEqual(wire.error_code(server.route(data, None)), expected)
+
+    def test_non_ascii_is_not_a_length_error(self):
+        data = wire.HEADER.pack(wire.INDIVIDUAL_TOKEN_REQUEST) + b'\xff' * wire.ID_SIZE + b'\0' * 4
+        self.assertIsNone(wire.frame_error(data))
+        self.assertEqual(wire.error_code(server.route(data, None)), ASCII_DECODE_ERROR)
+
+
+if __name__ == '__main__':
+    unittest.main()
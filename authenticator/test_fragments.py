@@ -0,0 +1,78 @@
+import hashlib
+import unittest
+
+import wire
+from fragments import Reassembler
+from wire import INVALID_PARAMETER, INVALID_SINGLE_TOKEN, SAS_SIZE
+
+
+ADDRESS = ('127.0.0.1', 40000)
+BAD_NONCE = 13
+
+
+def make_sas(nonce):
+    return wire.SAS.pack(b'2016006492'.ljust(wire.ID_SIZE), nonce, hashlib.sha256(b'%d' % nonce).hexdigest().encode())
+
+def check_sas(student_id, nonce, token):
+    return INVALID_SINGLE_TOKEN if nonce == BAD_NONCE else None
+
+def group_token(sas_list):
+    return hashlib.sha256(b''.join(sas_list)).hexdigest().encode()
+
+
+class ReassemblerTest(unittest.TestCase):
+    def setUp(self):
+        self.reassembler = Reassembler(check_sas, hashlib.sha256)
+        # Large enough to need several fragments
+        self.sas_list = [make_sas(nonce) for nonce in range(100, 130)]
+
+    def send(self, frames, address=ADDRESS):
+        return [self.reassembler.handle(frame, address) for frame in frames]
+
+    def test_request_in_order(self):
+        frames = wire.split_fragments(wire.group_token_request(self.sas_list), 1)
+        self.assertGreater(len(frames), 1)
+        replies = self.send(frames)
+        for seq, reply in enumerate(replies[:-1]):
+            self.assertEqual(reply, wire.fragment_ack(wire.GROUP_TOKEN_REQUEST, 1, seq, len(frames)))
+        self.assertEqual(replies[-1], wire.fragment_result(wire.GROUP_TOKEN_RESPONSE, 1, len(self.sas_list),
+                                                           group_token(self.sas_list)))
+
+    def test_request_out_of_order(self):
+        frames = wire.split_fragments(wire.group_token_request(self.sas_list), 1)
+        replies = self.send(list(reversed(frames)))
+        self.assertEqual(wire.message_type(replies[-1]), wire.FRAGMENT_RESULT)
+        self.assertEqual(bytes(replies[-1][-wire.TOKEN_SIZE:]), group_token(self.sas_list))
+
+    def test_retransmitted_fragment_gets_same_result(self):
+        frames = wire.split_fragments(wire.group_token_request(self.sas_list), 1)
+        result = self.send(frames)[-1]
+        self.assertEqual(self.send(frames[:1]), [result])
+
+    def test_transfers_are_kept_apart(self):
+        first = wire.split_fragments(wire.group_token_request(self.sas_list), 1)
+        second = wire.split_fragments(wire.group_token_request(self.sas_list[:20]), 2)
+        replies = self.send([frame for pair in zip(first, second) for frame in pair] + first[len(second):])
+        results = {bytes(reply[-wire.TOKEN_SIZE:]) for reply in replies
+                   if wire.message_type(reply) == wire.FRAGMENT_RESULT}
+        self.assertEqual(results, {group_token(self.sas_list), group_token(self.sas_list[:20])})
+
+    def test_invalid_sas_is_an_error(self):
+        sas_list = self.sas_list[:20] + [make_sas(BAD_NONCE)] + self.sas_list[20:]
+        replies = self.send(wire.split_fragments(wire.group_token_request(sas_list), 1))
+        self.assertIn(wire.error_message(INVALID_SINGLE_TOKEN), replies)
+
+    def test_validation(self):
+        token = group_token(self.sas_list)
+        valid = self.send(wire.split_fragments(wire.group_token_validation(self.sas_list, token), 1))[-1]
+        invalid = self.send(wire.split_fragments(wire.group_token_validation(self.sas_list, b'0' * 64), 2))[-1]
+        self.assertEqual(valid[-1], 0)
+        self.assertEqual(invalid[-1], 1)
+
+    def test_sequence_beyond_total(self):
+        frame = wire.FRAGMENT_HEADER.pack(wire.FRAGMENT, wire.GROUP_TOKEN_REQUEST, 1, 3, 3) + b'x' * SAS_SIZE
+        self.assertEqual(self.reassembler.handle(frame, ADDRESS), wire.error_message(INVALID_PARAMETER))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+import wire
+from ledger import LEDGER_HEADER, MAGIC, TokenLedger
+
+
+FINGERPRINT = b'k' * 64
+
+
+def student(n):
+    return f'{n:012d}'.encode('ascii')
+
+def token(n):
+    return f'{n:064x}'.encode('ascii')
+
+def members(*numbers):
+    return b''.join(wire.SAS.pack(student(n), n, token(n)) for n in numbers)
+
+
+class TokenLedgerTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ledger')
+        self.ledger = None
+
+    def tearDown(self):
+        if self.ledger is not None:
+            self.ledger.close()
+
+    def open(self, fingerprint=FINGERPRINT, max_records=1 << 20):
+        if self.ledger is not None:
+            self.ledger.close()
+        self.ledger = TokenLedger(self.path, fingerprint, max_records)
+        return self.ledger
+
+    def test_lookups(self):
+        ledger = self.open()
+        ledger.add_token(student(1), 1, token(1))
+        ledger.add_group(members(2, 3), token(99))
+        self.assertEqual(ledger.token(student(1), 1), token(1))
+        self.assertIsNone(ledger.token(student(1), 2))
+        self.assertEqual(ledger.group_status(members(2, 3), token(99)), 0)
+        self.assertEqual(ledger.group_status(members(3, 2), token(99)), 1)
+        self.assertEqual(ledger.group_status(members(2), token(99)), 1)
+        self.assertIsNone(ledger.group_status(members(2, 3), token(98)))
+
+    def test_reopen_with_warm_index(self):
+        ledger = self.open()
+        for n in range(10):
+            ledger.add_token(student(n), n, token(n))
+        ledger.add_group(members(1, 2, 3), token(99))
+        stats = ledger.stats()
+        ledger = self.open()
+        self.assertEqual(ledger.stats(), stats)
+        self.assertEqual(ledger.token(student(7), 7), token(7))
+        self.assertEqual(ledger.group_status(members(1, 2, 3), token(99)), 0)
+
+    def test_key_change_discards_ledger(self):
+        ledger = self.open()
+        ledger.add_token(student(1), 1, token(1))
+        ledger = self.open(fingerprint=b'other'.ljust(64, b'\0'))
+        self.assertEqual(ledger.stats(), {"records": 0, "tokens": 0, "groups": 0})
+        self.assertIsNone(ledger.token(student(1), 1))
+
+    def test_truncated_group_record_dropped(self):
+        # A crash after the header counted the group record but only one of
+        # its three members
+        ledger = self.open()
+        ledger.add_token(student(1), 1, token(1))
+        ledger.add_group(members(2, 3, 4), token(99))
+        LEDGER_HEADER.pack_into(ledger.map, 0, MAGIC, 3, FINGERPRINT)
+        ledger = self.open()
+        self.assertEqual(ledger.stats(), {"records": 1, "tokens": 1, "groups": 0})
+        self.assertEqual(ledger.token(student(1), 1), token(1))
+        self.assertIsNone(ledger.group_status(members(2, 3, 4), token(99)))
+        # The cut-off records are reused
+        ledger.add_group(members(5, 6), token(98))
+        self.assertEqual(self.open().group_status(members(5, 6), token(98)), 0)
+
+    def test_compaction_past_max_records(self):
+        # Records 1..15 fit; the next append compacts to the newest 8 and is
+        # itself dropped
+        ledger = self.open(max_records=16)
+        for n in range(15):
+            ledger.add_token(student(n), n, token(n))
+        ledger.add_token(student(15), 15, token(15))
+        compactor = ledger.compactor
+        if compactor is not None:
+            compactor.join()
+        self.assertEqual(ledger.stats(), {"records": 8, "tokens": 8, "groups": 0})
+        self.assertIsNone(ledger.token(student(6), 6))
+        self.assertIsNone(ledger.token(student(15), 15))
+        for n in range(7, 15):
+            self.assertEqual(ledger.token(student(n), n), token(n))
+        ledger.add_token(student(15), 15, token(15))
+        self.assertEqual(self.open(max_records=16).token(student(15), 15), token(15))
+
+    def test_compaction_keeps_groups_whole(self):
+        # The group and its members take records 5..8; keeping 5 records
+        # starts at the group record, not in the middle of it
+        ledger = self.open()
+        for n in range(4):
+            ledger.add_token(student(n), n, token(n))
+        ledger.add_group(members(4, 5, 6), token(99))
+        ledger.add_token(student(7), 7, token(7))
+        ledger.compact(5)
+        self.assertEqual(ledger.stats(), {"records": 5, "tokens": 1, "groups": 1})
+        self.assertEqual(ledger.group_status(members(4, 5, 6), token(99)), 0)
+        self.assertIsNone(ledger.token(student(3), 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+from ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('ratelimit.time')
+        patcher.start().monotonic = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refused(self):
+        limiter = RateLimiter(rate=1, burst=3)
+        self.assertEqual([limiter.allow('a') for _ in range(4)], [True, True, True, False])
+        # Other clients have their own bucket
+        self.assertTrue(limiter.allow('b'))
+
+    def test_default_burst(self):
+        self.assertEqual(RateLimiter(rate=0.5).burst, 1.0)
+        self.assertEqual(RateLimiter(rate=20).burst, 20)
+
+    def test_refill_at_rate(self):
+        limiter = RateLimiter(rate=2, burst=4)
+        for _ in range(4):
+            limiter.allow('a')
+        self.assertFalse(limiter.allow('a'))
+        self.now += 0.5
+        self.assertTrue(limiter.allow('a'))
+        self.assertFalse(limiter.allow('a'))
+
+    def test_refill_capped_at_burst(self):
+        limiter = RateLimiter(rate=10, burst=2)
+        limiter.allow('a')
+        self.now += 60
+        self.assertEqual([limiter.allow('a') for _ in range(3)], [True, True, False])
+
+    def test_cost(self):
+        limiter = RateLimiter(rate=1, burst=5)
+        self.assertTrue(limiter.allow('a', cost=4))
+        self.assertFalse(limiter.allow('a', cost=2))
+        # A refused request takes nothing
+        self.assertTrue(limiter.allow('a', cost=1))
+
+    def test_least_recently_seen_evicted(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+        limiter.allow('a')
+        limiter.allow('b')
+        limiter.allow('a')
+        limiter.allow('c')
+        self.assertEqual(limiter.stats(), {"clients": 2})
+        self.assertEqual(list(limiter.buckets), ['a', 'c'])
+        # 'b' starts over with a full bucket, evicting 'a'
+        self.assertTrue(limiter.allow('b'))
+        self.assertEqual(list(limiter.buckets), ['c', 'b'])
+        self.assertFalse(limiter.allow('c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import re
+import struct
+import unittest
+
+import wire
+
+
+CLI_TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli-tests.txt')
+
+
+# BASELINE PARSERS
+
+# The client's parsers before the shared codec, kept as the reference the
+# struct-based ones must match byte for byte
+def baseline_sas_to_bin(data):
+    student_id, nonce, token = data.split(':')
+    student_id_bytes = student_id.encode('ascii').ljust(12)
+    nonce_bytes = struct.pack('!I', int(nonce))
+    token_bytes = token.encode('ascii')
+    return (student_id_bytes + nonce_bytes + token_bytes)
+
+def baseline_bin_to_sas(data):
+    student_id = data[:12].decode('ascii').strip()
+    nonce = str(struct.unpack('!I', data[12:16])[0])
+    token = data[16:].decode('ascii')
+    return f"{student_id}:{nonce}:{token}"
+
+def baseline_bin_to_gas(data):
+    n = struct.unpack('!H', data[:2])[0]
+    sas_list = [baseline_bin_to_sas(data[2+i*80 : 2+(i+1)*80]) for i in range(n)]
+    token = data[-64:].decode('ascii')
+    return sas_list, token
+
+def baseline_gas_to_bin(data):
+    gas = data.split('+')
+    sas_list_bytes = [baseline_sas_to_bin(gas[i]) for i in range(len(gas)-1)]
+    token_bytes = gas[-1].encode('ascii')
+    return sas_list_bytes, token_bytes
+
+
+# SAMPLES
+
+def cli_samples():
+    # Every SAS and GAS printed or used in the recorded CLI sessions
+    with open(CLI_TESTS) as f:
+        text = f.read()
+    gas_list = sorted(set(re.findall(r'(?:\S+:\d+:[0-9a-f]{64}\+)+[0-9a-f]{64}', text)))
+    sas_list = sorted(set(re.findall(r'[^\s+]+:\d+:[0-9a-f]{64}', text)))
+    return sas_list, gas_list
+
+
+class WireCodecTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sas_list, cls.gas_list = cli_samples()
+
+    def test_samples_found(self):
+        self.assertGreater(len(self.sas_list), 0)
+        self.assertGreater(len(self.gas_list), 0)
+
+    def test_sas_to_bin_matches_baseline(self):
+        for sas in self.sas_list:
+            with self.subTest(sas=sas):
+                self.assertEqual(wire.sas_to_bin(sas), baseline_sas_to_bin(sas))
+
+    def test_bin_to_sas_matches_baseline(self):
+        for sas in self.sas_list:
+            with self.subTest(sas=sas):
+                data = baseline_sas_to_bin(sas)
+                self.assertEqual(wire.bin_to_sas(data), baseline_bin_to_sas(data))
+                self.assertEqual(wire.bin_to_sas(data), sas)
+
+    def test_bin_to_sas_at_offset(self):
+        data = b''.join(baseline_sas_to_bin(sas) for sas in self.sas_list)
+        for i, sas in enumerate(self.sas_list):
+            self.assertEqual(wire.bin_to_sas(data, i * wire.SAS_SIZE), sas)
+
+    def test_gas_to_bin_matches_baseline(self):
+        for gas in self.gas_list:
+            with self.subTest(gas=gas):
+                self.assertEqual(wire.gas_to_bin(gas), baseline_gas_to_bin(gas))
+
+    def test_bin_to_gas_matches_baseline(self):
+        for gas in self.gas_list:
+            with self.subTest(gas=gas):
+                sas_bytes, token = baseline_gas_to_bin(gas)
+                data = struct.pack('!H', len(sas_bytes)) + b''.join(sas_bytes) + token
+                self.assertEqual(wire.bin_to_gas(data), baseline_bin_to_gas(data))
+                sas_list, token = wire.bin_to_gas(data)
+                self.assertEqual('+'.join(sas_list) + '+' + token, gas)
+
+    def test_request_builders_match_baseline(self):
+        sas_bytes, token = baseline_gas_to_bin(self.gas_list[0])
+        self.assertEqual(wire.individual_token_request('2016006492', 1),
+                         struct.pack('!H', 1) + '2016006492'.ljust(12).encode('ascii') + struct.pack('!I', 1))
+        self.assertEqual(wire.individual_token_validation(sas_bytes[0]), struct.pack('!H', 3) + sas_bytes[0])
+        self.assertEqual(wire.group_token_request(sas_bytes),
+                         struct.pack('!HH', 5, len(sas_bytes)) + b''.join(sas_bytes))
+        self.assertEqual(wire.group_token_validation(sas_bytes, token),
+                         struct.pack('!HH', 7, len(sas_bytes)) + b''.join(sas_bytes) + token)
+
+    def test_long_student_id_rejected(self):
+        with self.assertRaises(ValueError):
+            wire.sas_to_bin('x' * 13 + ':1:' + '0' * 64)
+        with self.assertRaises(ValueError):
+            wire.individual_token_request('x' * 13, 1)
+        self.assertEqual(len(wire.individual_token_request('x' * 12, 1)), wire.ITR_REQUEST.size)
+
+    def test_token_length_must_be_exact(self):
+        for token in ('', '0' * 63, '0' * 65):
+            with self.subTest(length=len(token)):
+                with self.assertRaises(ValueError):
+                    wire.sas_to_bin('2016006492:1:' + token)
+        self.assertEqual(len(wire.sas_to_bin('2016006492:1:' + '0' * 64)), wire.SAS_SIZE)
+
+    def test_nonce_out_of_range_rejected(self):
+        for nonce in (-1, 2 ** 32):
+            with self.subTest(nonce=nonce):
+                with self.assertRaises(ValueError):
+                    wire.individual_token_request('2016006492', nonce)
+                with self.assertRaises(ValueError):
+                    wire.sas_to_bin(f'2016006492:{nonce}:' + '0' * 64)
+        self.assertEqual(len(wire.individual_token_request('2016006492', 2 ** 32 - 1)), wire.ITR_REQUEST.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
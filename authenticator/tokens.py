@@ -0,0 +1,25 @@
+import hashlib
+import hmac
+import os
+
+
+# TOKEN KEYS
+
+# Deployments that must not accept tokens anyone can compute set a secret,
+# either in a file or in this environment variable
+SECRET_ENV = 'AUTH_SECRET'
+
+def load_secret(path=None):
+    # Returns the secret as bytes, or None for plain SHA-256 tokens
+    if path is not None:
+        with open(path, 'rb') as f:
+            return f.read().strip() or None
+    secret = os.environ.get(SECRET_ENV)
+    return secret.encode() if secret else None
+
+def token_hasher(secret=None):
+    # Prepared hasher to .copy() for every token: HMAC-SHA256 keyed with the
+    # secret when there is one, plain SHA-256 otherwise
+    if secret:
+        return hmac.new(secret, digestmod=hashlib.sha256)
+    return hashlib.sha256()
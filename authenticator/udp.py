@@ -0,0 +1,38 @@
+import socket
+
+
+# ADDRESS RESOLUTION
+
+# '' and '::' bind one dual-stack socket that takes IPv4 clients as
+# IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) alongside native IPv6 ones
+WILDCARD_HOSTS = ('', '::')
+
+def resolve(host, port):
+    # (family, address) for `host`. Names with both kinds of address resolve
+    # to IPv4, so 'localhost' means 127.0.0.1 on both ends as it always has.
+    if host in WILDCARD_HOSTS:
+        return socket.AF_INET6, ('::', port)
+    results = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_DGRAM)
+    for family, _, _, _, address in results:
+        if family == socket.AF_INET:
+            return family, address
+    family, _, _, _, address = results[0]
+    return family, address
+
+
+# SOCKETS
+
+def server_socket(host, port, reuse_port=False):
+    family, address = resolve(host, port)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    if family == socket.AF_INET6 and hasattr(socket, 'IPV6_V6ONLY'):
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(address)
+    return sock
+
+def client_socket(host, port):
+    # (socket, server address) with the socket in the server's family
+    family, address = resolve(host, port)
+    return socket.socket(family, socket.SOCK_DGRAM), address
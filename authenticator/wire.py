@@ -0,0 +1,177 @@
+import struct
+
+
+# MESSAGE TYPES
+INDIVIDUAL_TOKEN_REQUEST = 1
+INDIVIDUAL_TOKEN_RESPONSE = 2
+INDIVIDUAL_TOKEN_VALIDATION = 3
+INDIVIDUAL_TOKEN_STATUS = 4
+GROUP_TOKEN_REQUEST = 5
+GROUP_TOKEN_RESPONSE = 6
+GROUP_TOKEN_VALIDATION = 7
+GROUP_TOKEN_STATUS = 8
+FRAGMENT = 9
+FRAGMENT_ACK = 10
+FRAGMENT_RESULT = 11
+ERROR = 256
+
+# ERROR CODES
+INVALID_MESSAGE_CODE = 1
+INCORRECT_MESSAGE_LENGTH = 2
+INVALID_PARAMETER = 3
+INVALID_SINGLE_TOKEN = 4
+ASCII_DECODE_ERROR = 5
+
+ID_SIZE = 12
+TOKEN_SIZE = 64
+MAX_NONCE = 2 ** 32 - 1
+SAS_SIZE = 80
+
+# Largest UDP payload, and the largest group whose type 6 and type 8 replies
+# (type | N | SAS-1 ... SAS-N | token | s) still fit in one datagram
+MAX_DATAGRAM_SIZE = 65507
+MAX_GROUP_SIZE = (MAX_DATAGRAM_SIZE - 4 - TOKEN_SIZE - 1) // SAS_SIZE
+
+
+# PRECOMPILED LAYOUTS
+
+HEADER = struct.Struct('!H')                # type
+GROUP_HEADER = struct.Struct('!HH')         # type | N
+COUNT = struct.Struct('!H')                 # N
+ID_NONCE = struct.Struct('!12sI')           # ID | nonce
+SAS = struct.Struct('!12sI64s')             # ID | nonce | token
+STATUS = struct.Struct('B')                 # s
+ERROR_MESSAGE = struct.Struct('!HH')        # 256 | error code
+
+ITR_REQUEST = struct.Struct('!H12sI')       # 1 | ID | nonce
+ITR_RESPONSE = struct.Struct('!H12sI64s')   # 2 | ID | nonce | token
+ITV_RESPONSE_SIZE = HEADER.size + SAS_SIZE + STATUS.size
+
+# Fragmented group messages (types 5 and 7). Concatenating the payloads of
+# fragments 0..total-1 gives the message without its type field.
+FRAGMENT_HEADER = struct.Struct('!HHIHH')   # 9 or 10 | inner type | transfer id | seq | total
+FRAGMENT_RESULT_HEADER = struct.Struct('!HHIH')   # 11 | 6 or 8 | transfer id | N, then token or s
+FRAGMENT_PAYLOAD_SIZE = 12 * SAS_SIZE
+
+ERROR_MESSAGES = {code: ERROR_MESSAGE.pack(ERROR, code) for code in range(1, 6)}
+
+
+def error_message(error_code):
+    message = ERROR_MESSAGES.get(error_code)
+    if message is None:
+        message = ERROR_MESSAGE.pack(ERROR, error_code)
+    return message
+
+def frame_error(data):
+    # Error code for a datagram whose length is impossible for its type, or
+    # None. Uses only the type field and the length, so it can run before
+    # any handler and gives the same code the handler would.
+    size = len(data)
+    if size < HEADER.size:
+        return INCORRECT_MESSAGE_LENGTH
+    msg_type = message_type(data)
+    if msg_type == INDIVIDUAL_TOKEN_REQUEST:
+        return None if size == ITR_REQUEST.size else INCORRECT_MESSAGE_LENGTH
+    elif msg_type == INDIVIDUAL_TOKEN_VALIDATION:
+        return None if size == HEADER.size + SAS_SIZE else INCORRECT_MESSAGE_LENGTH
+    elif msg_type == GROUP_TOKEN_REQUEST:
+        body = size - GROUP_HEADER.size
+        return None if body >= 0 and body % SAS_SIZE == 0 else INVALID_PARAMETER
+    elif msg_type == GROUP_TOKEN_VALIDATION:
+        body = size - GROUP_HEADER.size - TOKEN_SIZE
+        return None if body >= SAS_SIZE and body % SAS_SIZE == 0 else INCORRECT_MESSAGE_LENGTH
+    elif msg_type == FRAGMENT:
+        return None if size >= FRAGMENT_HEADER.size else INCORRECT_MESSAGE_LENGTH
+    return INVALID_MESSAGE_CODE
+
+def message_type(data):
+    return HEADER.unpack_from(data)[0]
+
+def error_code(data):
+    return ERROR_MESSAGE.unpack_from(data)[1]
+
+def group_count(data, offset=0):
+    return COUNT.unpack_from(data, offset)[0]
+
+
+# SAS / GAS FIELDS
+
+def unpack_sas(data, offset=0):
+    # Raw fields of the SAS at `offset`: the ID is still space padded and the
+    # token is undecoded, so nothing is copied beyond the three fields
+    return SAS.unpack_from(data, offset)
+
+def iter_sas(data, count, offset=0):
+    for start in range(offset, offset + count * SAS_SIZE, SAS_SIZE):
+        yield SAS.unpack_from(data, start)
+
+
+# PARSERS
+
+def check_nonce(nonce):
+    # struct.error otherwise, which callers don't expect for bad input
+    if not 0 <= nonce <= MAX_NONCE:
+        raise ValueError(f"nonce must be between 0 and {MAX_NONCE}")
+    return nonce
+
+def sas_to_bin(data):
+    student_id, nonce, token = data.split(':')
+    student_id_bytes = student_id.encode('ascii')
+    if len(student_id_bytes) > ID_SIZE:
+        raise ValueError(f"student id longer than {ID_SIZE} characters")
+    # '64s' would pad a short token with NULs and cut a long one
+    token_bytes = token.encode('ascii')
+    if len(token_bytes) != TOKEN_SIZE:
+        raise ValueError(f"token must be {TOKEN_SIZE} characters")
+    return SAS.pack(student_id_bytes.ljust(ID_SIZE), check_nonce(int(nonce)), token_bytes)
+
+def bin_to_sas(data, offset=0):
+    student_id, nonce, token = SAS.unpack_from(data, offset)
+    return f"{student_id.decode('ascii').strip()}:{nonce}:{token.decode('ascii')}"
+
+def bin_to_gas(data):
+    n = group_count(data)
+    sas_list = [bin_to_sas(data, COUNT.size + i * SAS_SIZE) for i in range(n)]
+    token = bytes(data[-TOKEN_SIZE:]).decode('ascii')
+    return sas_list, token
+
+def gas_to_bin(data):
+    gas = data.split('+')
+    sas_list_bytes = [sas_to_bin(sas) for sas in gas[:-1]]
+    token_bytes = gas[-1].encode('ascii')
+    return sas_list_bytes, token_bytes
+
+
+# REQUEST BUILDERS
+
+def individual_token_request(student_id, nonce):
+    student_id_bytes = student_id.encode('ascii')
+    if len(student_id_bytes) > ID_SIZE:
+        raise ValueError(f"student id longer than {ID_SIZE} characters")
+    return ITR_REQUEST.pack(INDIVIDUAL_TOKEN_REQUEST, student_id_bytes.ljust(ID_SIZE), check_nonce(nonce))
+
+def individual_token_validation(sas):
+    return HEADER.pack(INDIVIDUAL_TOKEN_VALIDATION) + sas
+
+def group_token_request(sas_list):
+    return GROUP_HEADER.pack(GROUP_TOKEN_REQUEST, len(sas_list)) + b''.join(sas_list)
+
+def group_token_validation(sas_list, token):
+    return GROUP_HEADER.pack(GROUP_TOKEN_VALIDATION, len(sas_list)) + b''.join(sas_list) + token
+
+
+# FRAGMENTS
+
+def split_fragments(message, transfer_id):
+    inner_type = message_type(message)
+    body = memoryview(message)[HEADER.size:]
+    total = max(1, -(-len(body) // FRAGMENT_PAYLOAD_SIZE))
+    return [FRAGMENT_HEADER.pack(FRAGMENT, inner_type, transfer_id, seq, total)
+            + body[seq * FRAGMENT_PAYLOAD_SIZE:(seq + 1) * FRAGMENT_PAYLOAD_SIZE]
+            for seq in range(total)]
+
+def fragment_ack(inner_type, transfer_id, seq, total):
+    return FRAGMENT_HEADER.pack(FRAGMENT_ACK, inner_type, transfer_id, seq, total)
+
+def fragment_result(result_type, transfer_id, count, payload):
+    return FRAGMENT_RESULT_HEADER.pack(FRAGMENT_RESULT, result_type, transfer_id, count) + payload
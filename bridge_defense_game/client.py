@@ -1,52 +1,15 @@
-import socket
-import json
-import selectors
+import asyncio
 import sys
-import time
 
-N_RIVERS = 4
-N_BRIDGES = 8
-
-TIMEOUT = 20
-TIMEOUT_THRESHOLD = 50
+from engine import GameEngine, N_BRIDGES, N_RIVERS
+from planner import ShotPlanner
 
 AUX_FILE = "game_board.txt"
-
-selector = selectors.DefaultSelector()
-
-
-# GET CLIENT SOCKET CONNECTED TO MULTIPLEXER
-
-def get_socket(server_name):
-    try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    except OSError:
-        # If IPv4 is not supported, attempt to create a socket with IPv6
-        client_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-    client_socket.setblocking(False) 
-    selector.register(client_socket, selectors.EVENT_READ, data=server_name)
-    client_socket.settimeout(TIMEOUT)
-    return client_socket
-
-
-# SEND MESSAGE
-
-def send_message(client_socket, server_address, 
-                request_type, gas, turn, cannon_coord, ship_id):
-    message = {
-        "type": request_type,
-        "auth": gas
-    }
-    if turn is not None: message["turn"] = turn
-    if cannon_coord is not None: message["cannon"] = cannon_coord
-    if ship_id is not None: message["id"] = ship_id
-    client_socket.sendto(json.dumps(message).encode(), server_address)
-
-
-# RECEIVE MESSAGE
-
-def receive_message(client_socket):
-    return json.loads(client_socket.recv(1024).decode())
+# Asked for by the agent, which keeps its sessions for the whole game
+AGENT_FEATURES = ("binary", "batchstate")
+# Seconds the agent waits before asking again for a turn a server with a turn
+# timer hasn't reached yet
+TURN_POLL_INTERVAL = 0.05
 
 
 # PRINT ROUNDS TO FILE TO MAKE THE GAME EASIER TO VISUALIZE
@@ -100,6 +63,10 @@ def remove_ships_from_file(file_name=AUX_FILE):
             if board[row][col] == 'O':
                 board[row][col] = ' '
 
+    with open(file_name, 'w') as f:
+        for line in board:
+            f.write(''.join(line) + '\n')
+
 def print_ships_to_file(ship_coords, file_name=AUX_FILE):
     # Read existing board from file
     with open(file_name, 'r') as f:
@@ -111,10 +78,11 @@ def print_ships_to_file(ship_coords, file_name=AUX_FILE):
     for coord in ship_coords:
         col, row = coord
         # Rivers are every other row
-        board[2*col][2*row-1] = 'O' 
+        if 2*col < len(board) and 2*row-1 < len(board[2*col]):
+            board[2*col][2*row-1] = 'O' 
 
-    # Write the updated board to file
-    with open(file_name, 'a+') as f:
+    # Write the updated board back; appending it doubled the file every call
+    with open(file_name, 'w') as f:
         for line in board:
             f.write(''.join(line) + '\n')
 
@@ -144,85 +112,9 @@ def print_score_to_file(server_name, score, file_name=AUX_FILE):
         f.write(f"Server {server_name}: score {score}\n")
 
 
-# COMMAND LINE INTERFACE
-  
-def cli():
-    # Get server and base port from command line
-    server, base_port = (sys.argv[1], sys.argv[2])
-
-    # Generate dicts for games and servers, server_name is key for both dicts
-    # I chose to separate them to use the multiplexer more easily with the server sockets
-    servers = {}
-    for i in range(1, N_RIVERS+1):
-        port = base_port[:-1] + str(i)
-        server_address = (server, int(port))
-        servers[str(i)] = {"server_address": server_address, 
-                           "client_socket": get_socket(str(i)),
-                           "response": []}
-    
-    last_request_time = time.time() 
-    all_answered, right_n_answers = 0, 0
-    total_responses = N_RIVERS
-    while True: 
-        try:
-            request_type = sys.argv[3]
-            gas = sys.argv[4]
-                    
-            turn, cannon_coord, ship_id = None, None, None
-            if len(sys.argv) == 7:
-                cannon_coord = sys.argv[5]
-                ship_id = sys.argv[6]
-            elif len(sys.argv) == 6:
-                turn = sys.argv[5]
-            else:
-                pass
-
-            if request_type not in ["authreq", "quit", "getturn", "shot", "getcannons"]:
-                print("invalid message!")
-
-            for _, server_infos in servers.items():
-                send_message(client_socket=server_infos["client_socket"],
-                            server_address=server_infos["server_address"],
-                            request_type=request_type, gas=gas, 
-                            turn=turn, cannon_coord=cannon_coord, ship_id=ship_id)
-                if request_type == "getcannons":
-                    total_responses = 1
-                    break
-            
-            if request_type == "getturn":
-                remove_ships_from_file()
-                total_responses = N_RIVERS*N_BRIDGES
- 
-            events = selector.select()
-            
-            while all_answered < N_RIVERS and right_n_answers < total_responses: 
-                for key, _ in events:
-                    response = receive_message(servers.get(key.data)["client_socket"])
-
-                    if not servers[key.data]["response"]: 
-                        servers[key.data]["response"] = [response]
-                        all_answered += 1
-                        right_n_answers += 1
-                    
-                    elif request_type == "getturn" and len(servers[key.data]["response"]) < N_BRIDGES:
-                        servers[key.data]["response"].append(response)
-                        right_n_answers += 1
-        
-            break
-                        
-        except socket.timeout:
-            if time.time() - last_request_time > TIMEOUT_THRESHOLD:
-                print("Timeout occurred. Closing...")
-                break
-            else:
-               print("No answer. Resending requests.")      
-        except Exception as e:
-            print("Exceptional error:", e)
-            selector.close()
-            sys.exit()
-        
-    for server_name, server_info in servers.items():
-        for response in server_info["response"]:
+def print_responses(responses):
+    for server_name, server_responses in responses.items():
+        for response in server_responses:
             if "type" in response:
                 if response["type"] == "authresp":
                     if response["status"] == 0:
@@ -239,20 +131,30 @@ def cli():
 
                 elif response["type"] == "state":
                     if response["ships"]:
-                        ships_coord = [server_name, response["bridge"]]
-                        print_ships_to_file(ships_coord)
+                        print_ships_to_file([[server_name, response["bridge"]]])
                         for ship in response["ships"]:
                             ship["bridge"] = response["bridge"]
                             ship["river"] = server_name
                         print_ships_info_to_file(response["ships"])
 
+                elif response["type"] == "riverstate":
+                    for bridge, ships in response["bridges"].items():
+                        if ships:
+                            print_ships_to_file([[server_name, int(bridge)]])
+                            for ship in ships:
+                                ship["bridge"] = int(bridge)
+                                ship["river"] = server_name
+                            print_ships_info_to_file(ships)
+
                 elif response["type"] == "shotresp":
                     if response["status"] == 0:
                         print("Successful shot", server_name, 
                                 "ship", response["id"], 
                                 "shot by cannon", response["cannon"])
                     else:
-                        print("Shot missed the target", response["description"])
+                        print("Shot missed the target", server_name,
+                                "ship", response["id"],
+                                "shot by cannon", response["cannon"])
 
                 elif response["type"] == "gameover":
                     print("Gameover! Score printed on", AUX_FILE)
@@ -263,5 +165,108 @@ def cli():
             else:
                 print("ERROR: Response has no type", response)
 
+
+# AGENT MODE
+
+async def run_agent(server, base_port, gas, max_turns=None):
+    # Plays a whole game over one set of sockets: authenticate, fetch the
+    # cannons once, then getturn and shoot every turn until a gameover or
+    # max_turns. Turns with no ship in sight are played too, since ships
+    # keep arriving until the servers end the game. The turn played is the one the servers report, so the agent keeps up with
+    # servers that advance turns on a timer.
+    engine = GameEngine(server, base_port, gas)
+    await engine.connect()
+    try:
+        auth = await engine.authenticate(AGENT_FEATURES)
+        if any(reply["status"] != 0 for reply in auth.values()):
+            print("Error while authenticating")
+            return
+        rivers = {index: reply["river"] for index, reply in auth.items()}
+        planner = ShotPlanner((await engine.get_cannons())["cannons"], rivers)
+
+        scores, turn, played = {}, 0, 0
+        while max_turns is None or played < max_turns:
+            snapshot = await engine.get_turn(turn)
+            scores.update((index, message["score"]) for index, message in snapshot.gameover.items())
+            if snapshot.gameover:
+                break
+            if not snapshot.ready():
+                await asyncio.sleep(TURN_POLL_INTERVAL)
+                continue
+            ships = list(snapshot.ships())
+            turn = max(snapshot.turns.values())
+            shots = planner.plan(snapshot)
+            replies = await engine.shoot_all(shots)
+            hits = sum(reply.get("status") == 0 and reply["type"] == "shotresp" for reply in replies)
+            print(f"Turn {turn}: {len(ships)} ships, {len(shots)} shots, {hits} hits")
+            turn += 1
+            played += 1
+
+        scores.update((index, message["score"]) for index, message in (await engine.quit()).items()
+                      if index not in scores)
+        for index, score in sorted(scores.items()):
+            print(f"Server {index}: score {score}")
+    finally:
+        engine.close()
+
+
+# COMMAND LINE INTERFACE
+
+def parse_cannon(text):
+    # "x,y" or "[x,y]"
+    x, y = text.strip('[]() ').split(',')
+    return [int(x), int(y)]
+
+async def run_command(server, base_port, request_type, gas, args):
+    # Replies per river for one command, all rivers asked at once
+    engine = GameEngine(server, base_port, gas)
+    await engine.connect()
+    try:
+        if request_type == "authreq":
+            # authreq <GAS> [<feature,...>], e.g. batchstate
+            features = args[0].split(',') if args else ()
+            return {river: [reply] for river, reply in (await engine.authenticate(features)).items()}
+        elif request_type == "getcannons":
+            return {1: [await engine.get_cannons()]}
+        elif request_type == "getturn":
+            return (await engine.get_turn(int(args[0]))).messages
+        elif request_type == "shot":
+            cannon, ship_id = parse_cannon(args[0]), int(args[1])
+            rivers = list(engine.endpoints)
+            replies = await engine.shoot_all([(river, cannon, ship_id) for river in rivers])
+            return {river: [reply] for river, reply in zip(rivers, replies)}
+        else:
+            return {river: [reply] for river, reply in (await engine.quit()).items()}
+    finally:
+        engine.close()
+
+def cli():
+    # Get server and base port from command line
+    server, base_port = (sys.argv[1], sys.argv[2])
+    request_type, gas = sys.argv[3], sys.argv[4]
+    if request_type == "agent":
+        # agent <GAS> [<max turns>]
+        max_turns = int(sys.argv[5]) if len(sys.argv) > 5 else None
+        try:
+            asyncio.run(run_agent(server, base_port, gas, max_turns))
+        except TimeoutError:
+            print("Timeout occurred. Closing...")
+        return
+    if request_type not in ["authreq", "quit", "getturn", "shot", "getcannons"]:
+        print("invalid message!")
+        return
+    if request_type == "getturn":
+        remove_ships_from_file()
+
+    try:
+        responses = asyncio.run(run_command(server, base_port, request_type, gas, sys.argv[5:]))
+    except TimeoutError:
+        print("Timeout occurred. Closing...")
+        return
+    except (IndexError, ValueError):
+        print("invalid message!")
+        return
+    print_responses(responses)
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import struct
+import sys
+
+# Address resolution and the retransmission timer are shared with the authenticator
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'authenticator'))
+import protocol
+import udp
+from retransmit import RetransmissionTimer
+
+N_RIVERS = 4
+N_BRIDGES = 8
+
+
+# RIVER ENDPOINTS
+
+class RiverProtocol(asyncio.DatagramProtocol):
+    # One socket per river server. Every decoded reply goes to the first
+    # pending exchange that accepts it, so concurrent requests to the same
+    # river (a burst of shots) each get their own replies.
+    def __init__(self):
+        self.transport = None
+        self.waiters = []           # (accept, queue)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        # Truncated frames, unknown hull codes and JSON that isn't an object
+        # are dropped like a lost datagram. A tab is also the gameover frame
+        # type, so data that doesn't decode as a frame is tried as JSON.
+        message = None
+        if protocol.is_binary(data, protocol.MESSAGE_FRAMES):
+            try:
+                message = protocol.decode_message(data)
+            except (ValueError, struct.error):
+                pass
+        if message is None:
+            try:
+                message = json.loads(data)
+            except ValueError:
+                return
+        if not isinstance(message, dict):
+            return
+        for accept, queue in self.waiters:
+            if accept(message):
+                queue.put_nowait(message)
+                return
+
+    def error_received(self, exc):
+        pass
+
+
+class TurnSnapshot:
+    # Every river's state for one turn: bridges[river][bridge] is the list of
+    # ships there, gameover[river] the gameover message if that game ended.
+    # turns[river] is the turn the state is from, which is `turn` unless the
+    # server runs a turn timer and answered with the turn it is on.
+    def __init__(self, turn):
+        self.turn = turn
+        self.turns = {}
+        self.bridges = {}
+        self.gameover = {}
+        self.messages = {}
+
+    def ready(self):
+        # Whether every river that sent a state has reached `turn`
+        return all(turn >= self.turn for turn in self.turns.values())
+
+    def ships(self):
+        # (river, bridge, ship) for every ship in sight
+        for river, bridges in self.bridges.items():
+            for bridge, ships in bridges.items():
+                for ship in ships:
+                    yield river, bridge, ship
+
+
+# ENGINE
+
+class GameEngine:
+    # Talks to the N_RIVERS servers of one game at once. Each request is sent
+    # to its rivers concurrently and only a river that hasn't answered in time
+    # is asked again, with the timeout adapted to the measured RTT.
+    def __init__(self, host, base_port, gas, timer=None):
+        self.host = host
+        self.base_port = base_port
+        self.gas = gas
+        self.timer = timer if timer is not None else RetransmissionTimer()
+        self.endpoints = {}         # river -> RiverProtocol
+        self.addresses = {}         # river -> server address
+        self.handles = {}           # river -> binary session handle, once negotiated
+        self.features = {}          # river -> features the server agreed to
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        for river in range(1, N_RIVERS + 1):
+            family, address = udp.resolve(self.host, int(str(self.base_port)[:-1] + str(river)))
+            _, endpoint = await loop.create_datagram_endpoint(RiverProtocol, family=family)
+            self.endpoints[river] = endpoint
+            self.addresses[river] = address
+
+    def close(self):
+        for endpoint in self.endpoints.values():
+            endpoint.transport.close()
+
+    def encode(self, river, request_type, **fields):
+        handle = self.handles.get(river)
+        if handle is not None and request_type != "authreq":
+            return protocol.encode_request(request_type, handle, fields.get("turn"),
+                                           fields.get("cannon"), fields.get("id"))
+        message = {"type": request_type, "auth": self.gas}
+        message.update({key: value for key, value in fields.items() if value is not None})
+        return json.dumps(message).encode()
+
+    async def exchange(self, river, data, accept, done):
+        # Sends `data` to one river and collects the replies `accept` takes
+        # until `done` says they are complete, resending on timeout
+        loop = asyncio.get_running_loop()
+        endpoint = self.endpoints[river]
+        queue = asyncio.Queue()
+        waiter = (accept, queue)
+        endpoint.waiters.append(waiter)
+        replies = []
+        try:
+            for attempt in range(self.timer.max_retries + 1):
+                sent_at = loop.time()
+                endpoint.transport.sendto(data, self.addresses[river])
+                deadline = sent_at + self.timer.timeout(attempt)
+                while not done(replies):
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        replies.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                if done(replies):
+                    if attempt == 0:
+                        self.timer.observe(loop.time() - sent_at)
+                    return replies
+            raise TimeoutError(f"no reply from river {river}")
+        finally:
+            endpoint.waiters.remove(waiter)
+
+    async def gather(self, requests):
+        # {river: replies} for {river: coroutine}, all in flight at once
+        rivers = list(requests)
+        results = await asyncio.gather(*requests.values())
+        return dict(zip(rivers, results))
+
+    # REQUESTS
+
+    async def authenticate(self, features=()):
+        def accept(message):
+            return message.get("type") == "authresp"
+        data = self.encode(None, "authreq", features=list(features) if features else None)
+        replies = await self.gather({river: self.exchange(river, data, accept, bool)
+                                     for river in self.endpoints})
+        responses = {}
+        for river, (response, *_) in replies.items():
+            responses[river] = response
+            self.features[river] = set(response.get("features", ()))
+            if "handle" in response:
+                self.handles[river] = response["handle"]
+        return responses
+
+    async def get_cannons(self, river=1):
+        def accept(message):
+            return message.get("type") in ("cannons", "gameover")
+        replies = await self.exchange(river, self.encode(river, "getcannons"), accept, bool)
+        return replies[0]
+
+    async def get_turn(self, turn):
+        snapshot = TurnSnapshot(turn)
+
+        def accept(message):
+            # Only complete states, so a malformed one can't stall the turn.
+            # Any turn is taken: a server with a turn timer answers with its own.
+            if message.get("type") == "gameover":
+                return True
+            if not isinstance(message.get("turn"), int):
+                return False
+            if message.get("type") == "state":
+                return isinstance(message.get("bridge"), int) and isinstance(message.get("ships"), list)
+            return message.get("type") == "riverstate" and isinstance(message.get("bridges"), dict)
+
+        def latest(replies):
+            # A resend may be answered from a later turn; only the latest counts
+            last = max((reply["turn"] for reply in replies if reply["type"] != "gameover"), default=None)
+            return [reply for reply in replies if reply["type"] == "gameover" or reply["turn"] == last]
+
+        def done(replies):
+            # One riverstate, or a state per bridge; duplicates from resends
+            # count once
+            replies = latest(replies)
+            if any(reply["type"] in ("riverstate", "gameover") for reply in replies):
+                return True
+            return len({reply["bridge"] for reply in replies}) == N_BRIDGES
+
+        replies = await self.gather({river: self.exchange(river, self.encode(river, "getturn", turn=turn),
+                                                          accept, done)
+                                     for river in self.endpoints})
+        for river, messages in replies.items():
+            messages = snapshot.messages[river] = latest(messages)
+            bridges = snapshot.bridges[river] = {}
+            for message in messages:
+                if message["type"] == "gameover":
+                    snapshot.gameover[river] = message
+                    continue
+                snapshot.turns[river] = message["turn"]
+                if message["type"] == "riverstate":
+                    bridges.update((int(bridge), ships) for bridge, ships in message["bridges"].items())
+                else:
+                    bridges[message["bridge"]] = message["ships"]
+        return snapshot
+
+    async def shoot(self, river, cannon, ship_id):
+        # Safe to resend: the server answers a repeated shot of the same
+        # cannon in the same turn with the first one's status
+        cannon = list(cannon)
+
+        def accept(message):
+            return message.get("type") == "gameover" or (
+                message.get("type") == "shotresp" and message.get("id") == ship_id
+                and message.get("cannon") == cannon)
+
+        data = self.encode(river, "shot", cannon=cannon, id=ship_id)
+        replies = await self.exchange(river, data, accept, bool)
+        return replies[0]
+
+    async def shoot_all(self, shots):
+        # Sends every (river, cannon, ship id) at once; replies in shot order
+        return await asyncio.gather(*(self.shoot(river, cannon, ship_id) for river, cannon, ship_id in shots))
+
+    async def quit(self):
+        def accept(message):
+            return message.get("type") == "gameover"
+        replies = await self.gather({river: self.exchange(river, self.encode(river, "quit"), accept, bool)
+                                     for river in self.endpoints})
+        return {river: messages[0] for river, messages in replies.items()}
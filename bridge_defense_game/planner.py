@@ -0,0 +1,71 @@
+from collections import Counter
+
+from protocol import HULL_HITS, N_BRIDGES
+
+
+# HULLS
+
+def shots_to_sink(ship):
+    # Frigates, destroyers and battleships sink after 1, 2 and 3 hits
+    return max(1, HULL_HITS[ship["hull"]] - ship["hits"])
+
+
+# PLANNER
+
+class ShotPlanner:
+    # Built once per game from the getcannons response and the river each
+    # server runs (its authresp "river"). `reach[(server, bridge)]` lists the
+    # cannons that can hit ships on that bridge of that server's river, so a
+    # turn only looks up tables and never tests cannon positions.
+    def __init__(self, cannons, rivers):
+        self.cannons = [tuple(cannon) for cannon in cannons]
+        self.reach = {}             # (server, bridge) -> cannons
+        for cannon in self.cannons:
+            x, y = cannon
+            # A cannon at (x, y) stands on bridge x between rivers y and y+1
+            for server, river in rivers.items():
+                if y in (river - 1, river):
+                    self.reach.setdefault((server, x), []).append(cannon)
+
+    def targets(self, snapshot):
+        # (bridge, shots to sink, server, ship id, cannons) for every ship in
+        # reach of some cannon, most urgent first: ships on the last bridge
+        # get through at the next turn, and cheap kills go before dear ones
+        targets = []
+        for server, bridges in snapshot.bridges.items():
+            for bridge, ships in bridges.items():
+                cannons = self.reach.get((server, bridge))
+                if cannons:
+                    for ship in ships:
+                        targets.append((bridge, shots_to_sink(ship), server, ship["id"], cannons))
+        targets.sort(key=lambda target: (-target[0], target[1]))
+        return targets
+
+    def plan(self, snapshot):
+        # One shot per cannon as (server, cannon, ship id), ready for
+        # GameEngine.shoot_all. Greedy in two passes: first only ships the
+        # free cannons can sink this turn, then leftover cannons put hits on
+        # ships that stay on the river, since hits carry over to later turns.
+        # Among the cannons that reach a ship, the ones that reach the fewest
+        # other ships fire first, leaving the versatile ones for later.
+        targets = self.targets(snapshot)
+        demand = Counter(cannon for target in targets for cannon in target[4])
+        free = set(self.cannons)
+        shots = []
+
+        def fire(server, ship_id, cannons, count):
+            for cannon in sorted((cannon for cannon in cannons if cannon in free), key=demand.__getitem__)[:count]:
+                free.discard(cannon)
+                shots.append((server, list(cannon), ship_id))
+
+        remaining = []
+        for bridge, needed, server, ship_id, cannons in targets:
+            if sum(cannon in free for cannon in cannons) >= needed:
+                fire(server, ship_id, cannons, needed)
+            elif bridge < N_BRIDGES:
+                remaining.append((server, ship_id, cannons))
+        for server, ship_id, cannons in remaining:
+            if not free:
+                break
+            fire(server, ship_id, cannons, len(free))
+        return shots
@@ -0,0 +1,145 @@
+import struct
+
+
+# BINARY FRAMES
+
+# Negotiated at authreq with the "binary" feature. The authresp then carries
+# a random 64-bit session handle, and every later frame starts with its type
+# and that handle instead of the GAS. JSON stays available on the same port: a
+# datagram is only taken for a frame if it starts with a frame type of the
+# right direction, which no JSON text does.
+GETCANNONS = 1
+CANNONS = 2
+GETTURN = 3
+STATE = 4
+RIVERSTATE = 5
+SHOT = 6
+SHOTRESP = 7
+QUIT = 8
+GAMEOVER = 9
+
+# Frames a client sends, and frames a server sends back
+REQUEST_FRAMES = (GETCANNONS, GETTURN, SHOT, QUIT)
+MESSAGE_FRAMES = (CANNONS, STATE, RIVERSTATE, SHOTRESP, GAMEOVER)
+
+HULLS = ["frigate", "destroyer", "battleship"]
+HULL_CODES = {hull: code for code, hull in enumerate(HULLS)}
+# Hits that sink each hull, as in the problem spec
+HULL_HITS = {"frigate": 1, "destroyer": 2, "battleship": 3}
+
+FRAME = struct.Struct('!BQ')            # type | handle
+TURN = struct.Struct('!BQI')            # type | handle | turn
+STATE_HEADER = struct.Struct('!BQIB')   # 4 | handle | turn | bridge, then ship list
+SHOT_FRAME = struct.Struct('!BQBBI')    # 6 | handle | cannon x | cannon y | ship id
+SHOTRESP_FRAME = struct.Struct('!BQBBIB')   # 7 | handle | cannon x | cannon y | ship id | status
+GAMEOVER_FRAME = struct.Struct('!BQBI')     # 9 | handle | status | score
+COUNT = struct.Struct('!H')             # number of ships or cannons that follow
+SHIP = struct.Struct('!IBB')            # id | hull | hits
+CANNON = struct.Struct('!BB')           # x | y
+
+N_BRIDGES = 8
+
+
+def is_binary(data, frame_types=REQUEST_FRAMES):
+    return len(data) >= FRAME.size and data[0] in frame_types
+
+
+# ENCODING
+
+def pack_ships(ships):
+    return COUNT.pack(len(ships)) + b''.join(
+        SHIP.pack(ship["id"], HULL_CODES[ship["hull"]], ship["hits"]) for ship in ships)
+
+def encode_message(message, handle):
+    # Binary frame for a server message built as a JSON-style dict
+    message_type = message["type"]
+    if message_type == "state":
+        return (STATE_HEADER.pack(STATE, handle, message["turn"], message["bridge"])
+                + pack_ships(message["ships"]))
+    elif message_type == "riverstate":
+        bridges = message["bridges"]
+        return TURN.pack(RIVERSTATE, handle, message["turn"]) + b''.join(
+            pack_ships(bridges[bridge]) for bridge in range(1, N_BRIDGES + 1))
+    elif message_type == "shotresp":
+        x, y = message["cannon"]
+        return SHOTRESP_FRAME.pack(SHOTRESP, handle, x, y, message["id"], message["status"])
+    elif message_type == "cannons":
+        return FRAME.pack(CANNONS, handle) + COUNT.pack(len(message["cannons"])) + b''.join(
+            CANNON.pack(x, y) for x, y in message["cannons"])
+    elif message_type == "gameover":
+        return GAMEOVER_FRAME.pack(GAMEOVER, handle, message["status"], message["score"])
+    raise ValueError(f"no binary frame for {message_type}")
+
+def encode_request(request_type, handle, turn=None, cannon=None, ship_id=None):
+    if request_type == "getturn":
+        return TURN.pack(GETTURN, handle, turn)
+    elif request_type == "shot":
+        return SHOT_FRAME.pack(SHOT, handle, cannon[0], cannon[1], ship_id)
+    elif request_type == "getcannons":
+        return FRAME.pack(GETCANNONS, handle)
+    elif request_type == "quit":
+        return FRAME.pack(QUIT, handle)
+    raise ValueError(f"no binary frame for {request_type}")
+
+
+# DECODING
+
+def decode_request(data):
+    # (handle, request dict without "auth"); raises ValueError or struct.error
+    frame_type, handle = FRAME.unpack_from(data)
+    if frame_type == GETTURN and len(data) == TURN.size:
+        return handle, {"type": "getturn", "turn": TURN.unpack(data)[2]}
+    elif frame_type == SHOT and len(data) == SHOT_FRAME.size:
+        _, _, x, y, ship_id = SHOT_FRAME.unpack(data)
+        return handle, {"type": "shot", "cannon": [x, y], "id": ship_id}
+    elif frame_type == GETCANNONS and len(data) == FRAME.size:
+        return handle, {"type": "getcannons"}
+    elif frame_type == QUIT and len(data) == FRAME.size:
+        return handle, {"type": "quit"}
+    raise ValueError(f"invalid frame type {frame_type} or length {len(data)}")
+
+def unpack_ships(data, offset):
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    ships = []
+    for _ in range(count):
+        ship_id, hull, hits = SHIP.unpack_from(data, offset)
+        if hull >= len(HULLS):
+            raise ValueError(f"unknown hull code {hull}")
+        ships.append({"id": ship_id, "hull": HULLS[hull], "hits": hits})
+        offset += SHIP.size
+    return ships, offset
+
+def check_end(data, offset):
+    if offset != len(data):
+        raise ValueError(f"{len(data) - offset} bytes after the frame")
+
+def decode_message(data):
+    # Server frame as the same dict the JSON protocol would give, minus "auth";
+    # raises ValueError or struct.error
+    frame_type, _ = FRAME.unpack_from(data)
+    if frame_type == STATE:
+        _, _, turn, bridge = STATE_HEADER.unpack_from(data)
+        ships, offset = unpack_ships(data, STATE_HEADER.size)
+        check_end(data, offset)
+        return {"type": "state", "turn": turn, "bridge": bridge, "ships": ships}
+    elif frame_type == RIVERSTATE:
+        _, _, turn = TURN.unpack_from(data)
+        bridges, offset = {}, TURN.size
+        for bridge in range(1, N_BRIDGES + 1):
+            bridges[bridge], offset = unpack_ships(data, offset)
+        check_end(data, offset)
+        return {"type": "riverstate", "turn": turn, "bridges": bridges}
+    elif frame_type == SHOTRESP:
+        _, _, x, y, ship_id, status = SHOTRESP_FRAME.unpack(data)
+        return {"type": "shotresp", "cannon": [x, y], "id": ship_id, "status": status}
+    elif frame_type == CANNONS:
+        (count,) = COUNT.unpack_from(data, FRAME.size)
+        cannons = [list(CANNON.unpack_from(data, FRAME.size + COUNT.size + i * CANNON.size))
+                   for i in range(count)]
+        check_end(data, FRAME.size + COUNT.size + count * CANNON.size)
+        return {"type": "cannons", "cannons": cannons}
+    elif frame_type == GAMEOVER:
+        _, _, status, score = GAMEOVER_FRAME.unpack(data)
+        return {"type": "gameover", "status": status, "score": score}
+    raise ValueError(f"invalid frame type {frame_type}")
@@ -0,0 +1,43 @@
+import heapq
+import itertools
+import time
+
+
+# TURN TIMERS
+
+class TurnScheduler:
+    # One pending deadline per session in a heap, so advancing thousands of
+    # games costs O(log n) per turn and the event loop only ever sleeps until
+    # the earliest one. Entries of sessions that have ended since they were
+    # pushed are dropped when they come up.
+    def __init__(self, interval, advance, is_open):
+        self.interval = interval
+        self.advance = advance      # called with each session whose turn is due
+        self.is_open = is_open
+        self.heap = []
+        self.order = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, session, now=None):
+        now = time.monotonic() if now is None else now
+        heapq.heappush(self.heap, (now + self.interval, next(self.order), session))
+
+    def next_deadline(self):
+        return self.heap[0][0] if self.heap else None
+
+    def run_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, session = heapq.heappop(self.heap)
+            if not self.is_open(session):
+                continue
+            self.advance(session)
+            # Scheduled from the missed deadline, so a late loop doesn't
+            # drift, but from now after a whole turn was missed, so a stalled
+            # loop doesn't advance the game several times at once
+            deadline += self.interval
+            if deadline <= now:
+                deadline = now + self.interval
+            heapq.heappush(self.heap, (deadline, next(self.order), session))
@@ -1,97 +1,194 @@
-import socket
+import argparse
 import json
-import hashlib
+import os
 import random
-import sys
+import selectors
 import struct
+import time
+import sys
+from collections import deque
+
+# The SAS/GAS codec is shared with the authenticator
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'authenticator'))
+import udp
+import wire
+from cache import TokenCache
+from tokens import load_secret, token_hasher
+import protocol
+from protocol import HULL_HITS, HULLS
+from scheduler import TurnScheduler
+from sessions import MAX_SESSIONS, SESSION_TIMEOUT, SessionManager
 
 N_BRIDGES = 8
+# Optional protocol features a client can ask for in authreq:
+#   batchstate  one "riverstate" message per getturn instead of one "state" per bridge
+#   binary      struct frames keyed by a session handle after authreq (see protocol.py)
+FEATURES = {"batchstate", "binary"}
 
 ################ GAME ####################
+class Ship:
+    # A ship's bridge is never stored: it is `offset` plus the number of
+    # moves so far, so moving the whole fleet doesn't touch any ship. It
+    # sinks at its `max_hits`th hit.
+    __slots__ = ('id', 'hull', 'hits', 'max_hits', 'offset')
+
+    def __init__(self, ship_id, hull, max_hits, offset):
+        self.id = ship_id
+        self.hull = hull
+        self.hits = 0
+        self.max_hits = max_hits
+        self.offset = offset
+
+
 class Game:  
-    def start(self, river):
+    def start(self, river, n_ships=5):
         self.river = river
         self.cannons = [[1,0], [3,0], [8,1], [2,2], [3,3], [8,4]]
-        self.ships = []
+        self.cannon_set = {tuple(cannon) for cannon in self.cannons}
         self.turn = 0
-        n = 5
-        for i in range(n):
-            # Generate ships at server's river
-            # from a specific type and max hits
-            ship_types = ["frigate", "destroyer", "battleship"]
-            max_hits = random.randrange(len(ship_types))
-            hull = ship_types[max_hits]
-            # near a bridge
-            bridge = random.randint(1, N_BRIDGES+1)
-            self.ships.append({
-                "id": i,
-                "hull": hull,
-                "hits": 0,
-                "max_hits": max_hits,
-                "bridge": bridge
-                })
-    
-            self.score = 0
-    
+        self.score = 0
+        self.moves = 0
+        # cannon -> (ship id, status) of its shot this turn
+        self.fired = {}
+        # id -> ship, and one id -> ship bucket per bridge, bridge 1 first
+        self.ships = {}
+        self.bridges = deque({} for _ in range(N_BRIDGES))
+        for i in range(n_ships):
+            # Generate ships at server's river of a random hull near a bridge
+            self.add_ship(i, random.choice(HULLS), random.randint(1, N_BRIDGES))
+
+    def add_ship(self, ship_id, hull, bridge):
+        ship = Ship(ship_id, hull, HULL_HITS[hull], bridge - self.moves)
+        self.ships[ship_id] = ship
+        self.bridges[bridge - 1][ship_id] = ship
+
+    def bridge_of(self, ship):
+        return ship.offset + self.moves
+
+    def ships_on(self, bridge):
+        return self.bridges[bridge - 1].values()
+
     def update(self):
-        # Move ships for the future
-        for ship in self.ships:
-            if ship["bridge"]+1 < N_BRIDGES:
-                ship["bridge"] = ship["bridge"]+1
-            else:
-                self.score = self.score+1
-    
+        # Next turn. Move ships for the future: every bucket shifts one bridge
+        # down the river and ships leaving the last bridge get through and score
+        self.turn += 1
+        self.moves += 1
+        self.fired.clear()
+        escaped = self.bridges.pop()
+        self.bridges.appendleft({})
+        for ship_id in escaped:
+            del self.ships[ship_id]
+        self.score += len(escaped)
+
+    def can_reach(self, cannon, bridge):
+        # A cannon at (x, y) stands on bridge x between rivers y and y+1
+        x, y = cannon
+        return x == bridge and y in (self.river - 1, self.river)
+
     def shoot_ship(self, ship_id, cannon_coord):
         status = 1
-        if cannon_coord in self.cannons and any(item.get("id") == ship_id for item in self.ships):
-            if cannon_coord[1] in [self.ships[ship_id]["bridge"], self.ships[ship_id]["bridge"]]:
+        cannon = tuple(cannon_coord)
+        ship = self.ships.get(ship_id)
+        if ship is not None and cannon in self.cannon_set:
+            bridge = self.bridge_of(ship)
+            if self.can_reach(cannon, bridge):
                 status = 0
-                if self.ships[ship_id]["hits"]+1 >= self.ships[ship_id]["max_hits"]:
-                    self.ships.pop(ship_id)
+                if ship.hits + 1 >= ship.max_hits:
+                    del self.ships[ship_id]
+                    del self.bridges[bridge - 1][ship_id]
                 else:
-                    self.ships[ship_id]["hits"] = self.ships[ship_id]["hits"]+1
-        self.update()
+                    ship.hits += 1
+        return status
+
+    def fire(self, ship_id, cannon_coord):
+        # A cannon shoots once per turn. Clients resend shots whose reply was
+        # lost, so the same shot again gets the first one's status without a
+        # second hit, and a shot at another ship misses.
+        cannon = tuple(cannon_coord)
+        fired = self.fired.get(cannon)
+        if fired is not None:
+            return fired[1] if fired[0] == ship_id else 1
+        status = self.shoot_ship(ship_id, cannon)
+        if cannon in self.cannon_set:
+            self.fired[cannon] = (ship_id, status)
         return status
 
 
 ########### MESSAGE HANDLING ########################
 
-def send_message(message, client_address):
-    server_socket.sendto(json.dumps(message).encode(), client_address)
+def send_message(message, client_address, handle=None):
+    # Requests that came as binary frames carry the session handle, and their
+    # replies go back as frames too
+    if handle is not None:
+        data = protocol.encode_message(message, handle)
+    else:
+        data = json.dumps(message, separators=(',', ':')).encode()
+    try:
+        server_socket.sendto(data, client_address)
+    except BlockingIOError:
+        # Send buffer full: the datagram is lost like any other, and the
+        # client retransmits
+        pass
 
 # AUTHENTICATION REQUEST
 
-def sas_to_bin(data):
-    student_id, nonce, token = data.split(':')
-    student_id_bytes = student_id.encode('ascii').ljust(12)
-    nonce_bytes = struct.pack('!I', int(nonce))
-    token_bytes = token.encode('ascii')
-    return (student_id_bytes + nonce_bytes + token_bytes)
-
-def gas_to_bin(data):
-    gas = data.split('+')
-    sas_list_bytes = [sas_to_bin(gas[i]) for i in range(len(gas)-1)]
-    token_bytes = gas[-1].encode('ascii')
-    return sas_list_bytes, token_bytes
+# Must match the authenticator's key, set in serve() from --secret-file or
+# $AUTH_SECRET
+gas_hasher = token_hasher()
 
 def verify_gas(gas):
-    gas_list, bin_token = gas_to_bin(gas)
-    gas_list.append(bin_token)
-    message = struct.pack('!HH', 7, len(gas_list)-1) + b''.join(gas_list)
-    correct_token = hashlib.sha256(message[4:-64]).hexdigest()
-    if correct_token == gas[-64:]: 
+    try:
+        sas_list, _ = wire.gas_to_bin(gas)
+    except (ValueError, struct.error):
+        # Not a GAS at all
+        return 1
+    if not sas_list:
+        # Just a token: the hash of no SAS can be computed by anyone
+        return 1
+    hasher = gas_hasher.copy()
+    for sas in sas_list:
+        hasher.update(sas)
+    if hasher.hexdigest() == gas[-64:]: 
         return 0
     else: 
         return 1
 
-def handle_auth_request(request, game, client_address):
-    status = verify_gas(request["auth"])
+# Verification results by GAS, so retransmitted or repeated authreqs (and
+# floods of the same bad GAS) are answered without rehashing. Later requests
+# are checked by looking their GAS up in the open sessions, which only
+# verified GAS get.
+AUTH_CACHE_SIZE = 4096
+auth_cache = TokenCache(AUTH_CACHE_SIZE)
+
+def verify_gas_cached(gas):
+    status = auth_cache.get(gas)
+    if status is None:
+        status = verify_gas(gas)
+        auth_cache.put(gas, status)
+    return status
+
+def handle_auth_request(request, client_address):
+    # A valid GAS opens its game, or resumes it if one is running. The reply
+    # lists which of the requested features the session will use.
+    status = verify_gas_cached(request["auth"])
+    requested = request.get("features")
+    # Unknown or non-string entries are ignored, never hashed
+    features = ([f for f in requested if isinstance(f, str) and f in FEATURES]
+                if isinstance(requested, list) else [])
+    session = sessions.open(request["auth"]) if status == 0 else None
+    if session is not None:
+        session.features = set(features)
+        session.address = client_address
     message = {
         "type": "authresp",
          "auth": request["auth"],
         "status": status,
-        "river": game.river
+        "river": river
     }
+    if requested is not None:
+        message["features"] = features if session is not None else []
+        if session is not None and "binary" in session.features:
+            message["handle"] = session.handle
     send_message(message, client_address)
 
 
@@ -103,43 +200,68 @@ def handle_cannons_request(request, game, client_address):
         "auth": request["auth"],
         "cannons": game.cannons
     }
-    send_message(message, client_address)
+    send_message(message, client_address, request.get("handle"))
 
 
 # DISPLAY SHIPS IN THIS RIVER REQUEST
 
-def handle_turn_request(request, game, client_address):
-    if request["turn"] != game.turn:
-        handle_game_termination_request(request, game, client_address)
+def handle_turn_request(request, game, client_address, batched=False):
+    # Without a turn timer, asking for the next turn moves the river on. The
+    # current turn can be asked for again, so a retransmitted getturn gets
+    # the same state and shots aim at the ships the client was shown.
+    # With one, the river moves on its own and every getturn gets the state
+    # of the turn it is on, numbered so the client can follow.
+    turn = request["turn"]
+    if turn_interval is None:
+        if turn == game.turn + 1:
+            game.update()
+        if turn != game.turn:
+            handle_game_termination_request(request, game, client_address)
+            return
+    if batched:
+        handle_batched_turn_request(request, game, client_address)
         return
     
     # Get ships positions based on bridges
     for bridge in range(1, N_BRIDGES+1):   
-        ships = [{"id": obj["id"], "hull": obj["hull"], "hits": obj["hits"]} 
-                 for obj in game.ships if obj.get("bridge") == bridge]
+        ships = [{"id": ship.id, "hull": ship.hull, "hits": ship.hits}
+                 for ship in game.ships_on(bridge)]
         # Generate and send message request
         message = {
             "type": "state",
             "auth": request["auth"],
-            "turn": request["turn"],
+            "turn": game.turn,
             "bridge": bridge,
             "ships": ships
             }
-        send_message(message, client_address)
-    game.update()
+        send_message(message, client_address, request.get("handle"))
+
+def handle_batched_turn_request(request, game, client_address):
+    # Whole river in one datagram, with every bridge listed even when empty
+    bridges = {}
+    for bridge in range(1, N_BRIDGES+1):
+        bridges[bridge] = [{"id": ship.id, "hull": ship.hull, "hits": ship.hits}
+                           for ship in game.ships_on(bridge)]
+    message = {
+        "type": "riverstate",
+        "auth": request["auth"],
+        "turn": game.turn,
+        "bridges": bridges
+        }
+    send_message(message, client_address, request.get("handle"))
 
 
 # SHOT REQUEST
 
 def handle_shot_request(request, game, client_address):
-    status = game.shoot_ship(request["id"], request["cannon"])
+    status = game.fire(request["id"], request["cannon"])
     message = {"type": "shotresp", 
                "auth": request["auth"], 
                "cannon": request["cannon"], 
                "id": request["id"], 
                "status": status
             }
-    send_message(message, client_address)
+    send_message(message, client_address, request.get("handle"))
 
     
 # QUITTING REQUEST
@@ -149,56 +271,163 @@ def handle_game_termination_request(request, game, client_address):
         "type": "gameover", 
         "auth": request["auth"], 
         "status": 0, 
-        "score": {game.score}
+        "score": game.score
         }
-    send_message(message, client_address)
+    send_message(message, client_address, request.get("handle"))
+
+
+# GAMEOVER BY IDLE TIMEOUT
+
+def handle_idle_session(session):
+    if session.address is None:
+        return
+    message = {
+        "type": "gameover",
+        "auth": session.key,
+        "status": 0,
+        "score": session.game.score
+        }
+    send_message(message, session.address, session.handle if "binary" in session.features else None)
 
 
 # GAMEOVER BY INVALID MESSAGE
 
-def handle_game_termination_by_invalid_message(game, client_address):
+def handle_game_termination_by_invalid_message(game, client_address, handle=None):
     message = {
         "type": "gameover", 
         "status": 1, 
-        "score": {game.score}
+        "score": game.score if game is not None else 0
         }
-    send_message(message, client_address)
+    send_message(message, client_address, handle)
 
     
 ########### SERVER ###############
 
-def serve():
-    # TODO TIMER FOR GAMEOVER
-    global server_socket
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    #server_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
-    port = sys.argv[1]
-    server_socket.bind(('localhost', int(port)))
-        
-    print(f"Server on port {port} is listening...")
-        
+def new_game():
     game = Game()
-    game.start(int(port[-1]))
-       
-    while True:
-        request, client_address = server_socket.recvfrom(1024)
-        request_json = json.loads(request.decode())
-        request_type = request_json.get("type")
-        if request_type == "authreq":
-            handle_auth_request(request_json, game, client_address)
-        elif request_type == "getcannons":
-            handle_cannons_request(request_json, game, client_address)
+    game.start(river, n_ships)
+    return game
+
+def handle_request(request, client_address):
+    # Every request but authreq needs the game of an authenticated GAS
+    request_type = request.get("type") if isinstance(request, dict) else None
+    gas = request.get("auth") if isinstance(request, dict) else None
+    if request_type == "authreq" and isinstance(gas, str):
+        handle_auth_request(request, client_address)
+        return
+    session = sessions.get(gas) if isinstance(gas, str) else None
+    if session is None:
+        handle_game_termination_by_invalid_message(None, client_address)
+        return
+    session.address = client_address
+    handle_session_request(request, session, client_address)
+
+def handle_binary_request(data, client_address):
+    # Frames name their session by handle, which only "binary" sessions get
+    handle = protocol.FRAME.unpack_from(data)[1]
+    session = sessions.by_handle(handle)
+    if session is None or "binary" not in session.features:
+        handle_game_termination_by_invalid_message(None, client_address, handle)
+        return
+    try:
+        _, request = protocol.decode_request(data)
+    except (ValueError, struct.error):
+        request = {"type": None}
+    request["auth"] = session.key
+    request["handle"] = handle
+    session.address = client_address
+    handle_session_request(request, session, client_address)
+
+def handle_session_request(request, session, client_address):
+    gas = session.key
+    game = session.game
+    request_type = request.get("type")
+    try:
+        if request_type == "getcannons":
+            handle_cannons_request(request, game, client_address)
         elif request_type == "getturn":
-            handle_turn_request(request_json, game, client_address)
+            handle_turn_request(request, game, client_address, "batchstate" in session.features)
         elif request_type == "shot":
-            handle_shot_request(request_json, game, client_address)
+            handle_shot_request(request, game, client_address)
         elif request_type == "quit":
-            handle_game_termination_request(request_json, game, client_address)
-            break
+            handle_game_termination_request(request, game, client_address)
+            sessions.close(gas)
         else:
-            handle_game_termination_by_invalid_message(game, client_address)
-            break
-        
+            raise ValueError(request_type)
+    except (KeyError, TypeError, ValueError, IndexError, struct.error):
+        # Missing or malformed fields end this game only
+        handle_game_termination_by_invalid_message(game, client_address, request.get("handle"))
+        sessions.close(gas)
+
+def handle_datagram(request, client_address):
+    if protocol.is_binary(request):
+        handle_binary_request(request, client_address)
+        return
+    try:
+        request_json = json.loads(request.decode())
+    except (UnicodeDecodeError, ValueError):
+        request_json = None
+    handle_request(request_json, client_address)
+
+def advance_turn(session):
+    session.game.update()
+
+def serve():
+    global server_socket, sessions, river, n_ships, auth_cache, turn_interval, gas_hasher
+    parser = argparse.ArgumentParser(description="Bridge defense game server for one river")
+    parser.add_argument('port', help="UDP port, its last digit is the river number")
+    parser.add_argument('host', nargs='?', default='localhost',
+                        help="address to bind, '::' for every IPv4 and IPv6 address (default: localhost)")
+    parser.add_argument('--ships', type=int, default=5, help="ships per game (default: 5)")
+    parser.add_argument('--turn-interval', type=float, default=None,
+                        help="seconds per turn, advanced by the server, and getturn answers with "
+                             "the current turn; without it a getturn for the next turn advances the game")
+    parser.add_argument('--secret-file', default=None,
+                        help="verify GAS with HMAC-SHA256 keyed by this file's contents, as the "
+                             "authenticator does; without it $AUTH_SECRET is used if set")
+    parser.add_argument('--auth-cache-size', type=int, default=AUTH_CACHE_SIZE,
+                        help=f"GAS verification results kept, 0 disables (default: {AUTH_CACHE_SIZE})")
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS,
+                        help=f"games kept at once, the least recently active is evicted (default: {MAX_SESSIONS})")
+    parser.add_argument('--session-timeout', type=float, default=SESSION_TIMEOUT,
+                        help=f"seconds without requests before a game ends (default: {SESSION_TIMEOUT})")
+    args = parser.parse_args()
+
+    server_socket = udp.server_socket(args.host, int(args.port))
+    server_socket.setblocking(False)
+    river = int(args.port[-1])
+    n_ships = args.ships
+    turn_interval = args.turn_interval
+    gas_hasher = token_hasher(load_secret(args.secret_file))
+    auth_cache = TokenCache(args.auth_cache_size)
+    scheduler = None
+    sessions = SessionManager(new_game, args.max_sessions, args.session_timeout)
+    if turn_interval is not None:
+        scheduler = TurnScheduler(turn_interval, advance_turn, sessions.is_open)
+        sessions.on_open = scheduler.add
+
+    print(f"Server on port {args.port} is listening...")
+
+    # One event loop for every game: sleep until a datagram arrives or the
+    # next turn or idle deadline, whichever comes first
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+    while True:
+        deadlines = [d for d in (sessions.next_expiry(),
+                                 scheduler.next_deadline() if scheduler else None) if d is not None]
+        timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        if selector.select(timeout):
+            while True:
+                try:
+                    request, client_address = server_socket.recvfrom(1024)
+                except BlockingIOError:
+                    break
+                handle_datagram(request, client_address)
+        if scheduler is not None:
+            scheduler.run_due()
+        for session in sessions.expire():
+            handle_idle_session(session)
+
 
 if __name__ == "__main__":
     serve()
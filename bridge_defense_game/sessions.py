@@ -0,0 +1,96 @@
+import secrets
+import time
+from collections import OrderedDict
+
+
+# LIMITS
+
+MAX_SESSIONS = 4096             # games kept at once, the least recently active is evicted
+SESSION_TIMEOUT = 120           # seconds without requests before a game is dropped
+# The handle is the only credential a binary frame carries, so it has to be
+# unguessable even with every session slot taken
+HANDLE_BITS = 64
+
+
+# SESSIONS
+
+class Session:
+    def __init__(self, key, handle, game):
+        self.key = key
+        self.handle = handle        # stands in for the key in binary frames
+        self.game = game
+        self.features = set()       # protocol options agreed at authreq
+        self.address = None         # where the last request came from
+        self.last_seen = time.monotonic()
+
+
+class SessionManager:
+    # Independent games in one process, one per key (the player's GAS).
+    # Sessions are kept in order of activity, so both eviction and idle
+    # expiry only ever look at the front.
+    def __init__(self, new_game, max_sessions=MAX_SESSIONS, timeout=SESSION_TIMEOUT, on_open=None):
+        self.new_game = new_game
+        self.on_open = on_open      # called with every new session
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.sessions = OrderedDict()
+        self.handles = {}           # handle -> key
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def open(self, key):
+        # The running session for `key`, or a new game if there is none, so a
+        # repeated authreq doesn't restart the game
+        session = self.get(key)
+        if session is None:
+            if len(self.sessions) >= self.max_sessions:
+                _, evicted = self.sessions.popitem(last=False)
+                del self.handles[evicted.handle]
+            handle = secrets.randbits(HANDLE_BITS)
+            while handle in self.handles:
+                handle = secrets.randbits(HANDLE_BITS)
+            self.handles[handle] = key
+            session = self.sessions[key] = Session(key, handle, self.new_game())
+            if self.on_open is not None:
+                self.on_open(session)
+        return session
+
+    def get(self, key):
+        session = self.sessions.get(key)
+        if session is not None:
+            session.last_seen = time.monotonic()
+            self.sessions.move_to_end(key)
+        return session
+
+    def is_open(self, session):
+        return self.sessions.get(session.key) is session
+
+    def next_expiry(self):
+        # When the least recently active session will go idle, or None
+        if not self.sessions:
+            return None
+        return next(iter(self.sessions.values())).last_seen + self.timeout
+
+    def by_handle(self, handle):
+        key = self.handles.get(handle)
+        return self.get(key) if key is not None else None
+
+    def close(self, key):
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            del self.handles[session.handle]
+        return session
+
+    def expire(self, now=None):
+        # Drops idle sessions and returns them
+        now = time.monotonic() if now is None else now
+        expired = []
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if session.last_seen + self.timeout > now:
+                break
+            del self.sessions[key]
+            del self.handles[session.handle]
+            expired.append(session)
+        return expired
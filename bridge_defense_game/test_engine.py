@@ -0,0 +1,154 @@
+import asyncio
+import json
+import unittest
+
+from engine import N_BRIDGES, GameEngine, RiverProtocol
+from retransmit import RetransmissionTimer
+
+
+class FakeTransport:
+    # Stands in for a river's socket: `respond` gets every request sent and
+    # returns the replies, which arrive on the next loop iteration
+    def __init__(self, endpoint, respond):
+        self.endpoint = endpoint
+        self.respond = respond
+        self.sent = []
+
+    def sendto(self, data, address):
+        request = json.loads(data)
+        self.sent.append(request)
+        loop = asyncio.get_running_loop()
+        for reply in self.respond(request):
+            data = reply if isinstance(reply, bytes) else json.dumps(reply).encode()
+            loop.call_soon(self.endpoint.datagram_received, data, address)
+
+    def close(self):
+        pass
+
+
+def make_engine(respond, rivers=(1,)):
+    engine = GameEngine('localhost', 51110, 'gas', RetransmissionTimer(initial_rto=0.05, max_retries=2))
+    for river in rivers:
+        endpoint = RiverProtocol()
+        endpoint.connection_made(FakeTransport(endpoint, respond))
+        engine.endpoints[river] = endpoint
+        engine.addresses[river] = ('127.0.0.1', 51110 + river)
+    return engine
+
+def states(turn, ships=None):
+    # One "state" per bridge, with `ships` {bridge: ships} and the rest empty
+    ships = ships or {}
+    return [{"type": "state", "auth": "gas", "turn": turn, "bridge": bridge, "ships": ships.get(bridge, [])}
+            for bridge in range(1, N_BRIDGES + 1)]
+
+
+class RiverProtocolTest(unittest.TestCase):
+    def test_replies_go_to_first_accepting_waiter(self):
+        endpoint = RiverProtocol()
+        shots, turns = asyncio.Queue(), asyncio.Queue()
+        endpoint.waiters.append((lambda message: message["type"] == "shotresp", shots))
+        endpoint.waiters.append((lambda message: True, turns))
+        endpoint.datagram_received(b'{"type": "shotresp"}', None)
+        endpoint.datagram_received(b'{"type": "state"}', None)
+        self.assertEqual(shots.get_nowait()["type"], "shotresp")
+        self.assertEqual(turns.get_nowait()["type"], "state")
+
+    def test_malformed_replies_dropped(self):
+        endpoint = RiverProtocol()
+        queue = asyncio.Queue()
+        endpoint.waiters.append((lambda message: True, queue))
+        for data in (b'not json', b'[1, 2]', b'\xff\xfe', b'\x04\x00'):
+            endpoint.datagram_received(data, None)
+        self.assertTrue(queue.empty())
+
+    def test_json_with_leading_tab(self):
+        # Tab is the gameover frame type, but this doesn't decode as a frame
+        endpoint = RiverProtocol()
+        queue = asyncio.Queue()
+        endpoint.waiters.append((lambda message: True, queue))
+        endpoint.datagram_received(b'\t{"type": "gameover", "status": 0, "score": 3}', None)
+        self.assertEqual(queue.get_nowait()["score"], 3)
+
+
+class GameEngineTest(unittest.IsolatedAsyncioTestCase):
+    async def test_shot_replies_routed_by_cannon_and_id(self):
+        # Replies to a burst of shots arrive in reverse order
+        pending = []
+
+        def respond(request):
+            pending.append({"type": "shotresp", "auth": "gas", "cannon": request["cannon"],
+                            "id": request["id"], "status": request["id"] % 2})
+            return reversed(pending) if len(pending) == 3 else []
+
+        engine = make_engine(respond)
+        replies = await engine.shoot_all([(1, (2, 2), 0), (1, (8, 1), 1), (1, (3, 3), 2)])
+        self.assertEqual([(reply["cannon"], reply["id"], reply["status"]) for reply in replies],
+                         [([2, 2], 0, 0), ([8, 1], 1, 1), ([3, 3], 2, 0)])
+
+    async def test_lost_reply_is_resent(self):
+        def respond(request):
+            if len(transport.sent) == 1:
+                return []
+            return [{"type": "shotresp", "auth": "gas", "cannon": request["cannon"], "id": 0, "status": 0}]
+
+        engine = make_engine(respond)
+        transport = engine.endpoints[1].transport
+        reply = await engine.shoot(1, (2, 2), 0)
+        self.assertEqual(reply["status"], 0)
+        self.assertEqual(len(transport.sent), 2)
+
+    async def test_turn_done_with_every_bridge(self):
+        # Duplicates count once, so a turn missing a bridge is asked again
+        def respond(request):
+            replies = states(request["turn"], {3: [{"id": 0, "hull": "frigate", "hits": 0}]})
+            return replies if len(transport.sent) > 1 else replies[:-1] * 2
+
+        engine = make_engine(respond)
+        transport = engine.endpoints[1].transport
+        snapshot = await engine.get_turn(0)
+        self.assertEqual(len(transport.sent), 2)
+        self.assertEqual(len(snapshot.bridges[1]), N_BRIDGES)
+        self.assertEqual(list(snapshot.ships()), [(1, 3, {"id": 0, "hull": "frigate", "hits": 0})])
+
+    async def test_only_latest_turn_kept(self):
+        # A server with a turn timer moved on between the first send and the
+        # resend: the older, incomplete turn is dropped
+        def respond(request):
+            if len(transport.sent) == 1:
+                return states(4, {1: [{"id": 0, "hull": "frigate", "hits": 0}]})[:5]
+            return states(5, {2: [{"id": 0, "hull": "frigate", "hits": 0}]})
+
+        engine = make_engine(respond)
+        transport = engine.endpoints[1].transport
+        snapshot = await engine.get_turn(4)
+        self.assertEqual(snapshot.turns, {1: 5})
+        self.assertTrue(snapshot.ready())
+        self.assertEqual([(bridge, ship["id"]) for _, bridge, ship in snapshot.ships()], [(2, 0)])
+
+    async def test_snapshot_not_ready_behind_turn(self):
+        engine = make_engine(lambda request: states(2), rivers=(1, 2))
+        snapshot = await engine.get_turn(3)
+        self.assertEqual(snapshot.turns, {1: 2, 2: 2})
+        self.assertFalse(snapshot.ready())
+
+    async def test_gameover_ends_turn(self):
+        def respond(request):
+            return [{"type": "gameover", "auth": "gas", "status": 0, "score": 4}]
+
+        engine = make_engine(respond)
+        snapshot = await engine.get_turn(1)
+        self.assertEqual(snapshot.gameover[1]["score"], 4)
+        self.assertEqual(snapshot.turns, {})
+
+    async def test_riverstate_reply(self):
+        def respond(request):
+            return [{"type": "riverstate", "auth": "gas", "turn": 1,
+                     "bridges": {"7": [{"id": 3, "hull": "battleship", "hits": 1}]}}]
+
+        engine = make_engine(respond)
+        snapshot = await engine.get_turn(1)
+        self.assertEqual(list(snapshot.ships()), [(1, 7, {"id": 3, "hull": "battleship", "hits": 1})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import importlib.util
+import os
+import unittest
+
+
+# The authenticator has a server module too, so this one is loaded by path
+# under its own name
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+spec = importlib.util.spec_from_file_location('bridge_server', SERVER_PATH)
+server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(server)
+
+RIVER = 2
+
+
+class GameTest(unittest.TestCase):
+    def setUp(self):
+        self.game = server.Game()
+        self.game.start(RIVER, n_ships=0)
+
+    def test_can_reach(self):
+        # Cannons on bridge 3 at either bank of river 2
+        self.assertTrue(self.game.can_reach((3, 1), 3))
+        self.assertTrue(self.game.can_reach((3, 2), 3))
+        self.assertFalse(self.game.can_reach((3, 0), 3))
+        self.assertFalse(self.game.can_reach((3, 3), 3))
+        self.assertFalse(self.game.can_reach((3, 2), 4))
+
+    def test_hits_to_sink(self):
+        # (2, 2) reaches bridge 2 of river 2
+        for ship_id, (hull, hits) in enumerate([("frigate", 1), ("destroyer", 2), ("battleship", 3)]):
+            self.game.add_ship(ship_id, hull, 2)
+            for _ in range(hits - 1):
+                self.assertEqual(self.game.shoot_ship(ship_id, [2, 2]), 0)
+                self.assertIn(ship_id, self.game.ships)
+            self.assertEqual(self.game.shoot_ship(ship_id, [2, 2]), 0)
+            self.assertNotIn(ship_id, self.game.ships)
+            self.assertNotIn(ship_id, self.game.bridges[1])
+
+    def test_missed_shots(self):
+        self.game.add_ship(0, "frigate", 2)
+        self.assertEqual(self.game.shoot_ship(0, [3, 3]), 1)     # cannon reaches other bridges
+        self.assertEqual(self.game.shoot_ship(0, [5, 2]), 1)     # not a cannon of this game
+        self.assertEqual(self.game.shoot_ship(7, [2, 2]), 1)     # no such ship
+        self.assertEqual(self.game.ships[0].hits, 0)
+
+    def test_repeated_shot_hits_once(self):
+        self.game.add_ship(0, "destroyer", 2)
+        self.assertEqual(self.game.fire(0, [2, 2]), 0)
+        self.assertEqual(self.game.fire(0, [2, 2]), 0)
+        self.assertEqual(self.game.ships[0].hits, 1)
+
+    def test_cannon_fires_once_per_turn(self):
+        self.game.add_ship(0, "destroyer", 2)
+        self.game.add_ship(1, "frigate", 2)
+        self.assertEqual(self.game.fire(0, [2, 2]), 0)
+        self.assertEqual(self.game.fire(1, [2, 2]), 1)
+        self.assertIn(1, self.game.ships)
+        self.game.update()
+        self.game.add_ship(2, "frigate", 2)
+        self.assertEqual(self.game.fire(2, [2, 2]), 0)
+        self.assertNotIn(2, self.game.ships)
+
+    def test_missed_shot_is_remembered(self):
+        self.assertEqual(self.game.fire(0, [2, 2]), 1)
+        self.game.add_ship(0, "frigate", 2)
+        self.assertEqual(self.game.fire(0, [2, 2]), 1)
+        self.assertIn(0, self.game.ships)
+
+    def test_update_moves_ships_and_scores_escapes(self):
+        self.game.add_ship(0, "frigate", 1)
+        self.game.add_ship(1, "destroyer", server.N_BRIDGES)
+        self.game.update()
+        self.assertEqual(self.game.turn, 1)
+        self.assertEqual(self.game.bridge_of(self.game.ships[0]), 2)
+        self.assertEqual(list(self.game.ships_on(2)), [self.game.ships[0]])
+        self.assertNotIn(1, self.game.ships)
+        self.assertEqual(self.game.score, 1)
+
+    def test_ship_added_after_moves(self):
+        self.game.update()
+        self.game.add_ship(0, "frigate", 2)
+        self.assertEqual(self.game.bridge_of(self.game.ships[0]), 2)
+        self.assertEqual(self.game.shoot_ship(0, [2, 2]), 0)
+
+
+class VerifyGasTest(unittest.TestCase):
+    def gas(self, sas_list):
+        hasher = server.gas_hasher.copy()
+        for sas in sas_list:
+            hasher.update(server.wire.sas_to_bin(sas))
+        return '+'.join(sas_list + [hasher.hexdigest()])
+
+    def test_valid_gas(self):
+        gas = self.gas(['2016006492:1:' + '0' * 64, '2016006493:2:' + '1' * 64])
+        self.assertEqual(server.verify_gas(gas), 0)
+        self.assertEqual(server.verify_gas(gas[:-1] + 'x'), 1)
+
+    def test_gas_without_sas_rejected(self):
+        self.assertEqual(server.verify_gas(self.gas([])), 1)
+
+    def test_not_a_gas(self):
+        self.assertEqual(server.verify_gas('2016006492:1:short+token'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from engine import TurnSnapshot
+from planner import ShotPlanner, shots_to_sink
+
+
+CANNONS = [[1, 0], [3, 0], [8, 1], [2, 2], [3, 3], [8, 4]]
+RIVERS = {1: 1, 2: 2, 3: 3, 4: 4}
+
+
+def ship(ship_id, hull, hits=0):
+    return {"id": ship_id, "hull": hull, "hits": hits}
+
+def snapshot(*placements):
+    # (server, bridge, ship) for every ship in sight
+    turn = TurnSnapshot(0)
+    for server, bridge, placed in placements:
+        turn.bridges.setdefault(server, {}).setdefault(bridge, []).append(placed)
+    return turn
+
+
+class ShotsToSinkTest(unittest.TestCase):
+    def test_hull_limits(self):
+        self.assertEqual(shots_to_sink(ship(0, "frigate")), 1)
+        self.assertEqual(shots_to_sink(ship(0, "destroyer")), 2)
+        self.assertEqual(shots_to_sink(ship(0, "destroyer", hits=1)), 1)
+        self.assertEqual(shots_to_sink(ship(0, "battleship")), 3)
+        self.assertEqual(shots_to_sink(ship(0, "battleship", hits=2)), 1)
+
+
+class ShotPlannerTest(unittest.TestCase):
+    def test_reachability_table(self):
+        planner = ShotPlanner(CANNONS, RIVERS)
+        self.assertEqual(planner.reach[(1, 8)], [(8, 1)])
+        self.assertEqual(planner.reach[(2, 8)], [(8, 1)])
+        self.assertEqual(planner.reach[(4, 8)], [(8, 4)])
+        self.assertEqual(planner.reach[(1, 3)], [(3, 0)])
+        self.assertEqual(planner.reach[(3, 3)], [(3, 3)])
+        self.assertNotIn((2, 3), planner.reach)
+
+    def test_no_ship_in_reach(self):
+        planner = ShotPlanner(CANNONS, RIVERS)
+        self.assertEqual(planner.plan(snapshot((2, 3, ship(0, "frigate")))), [])
+
+    def test_one_shot_per_cannon(self):
+        planner = ShotPlanner(CANNONS, RIVERS)
+        shots = planner.plan(snapshot((1, 8, ship(0, "frigate")), (2, 8, ship(1, "frigate"))))
+        self.assertEqual(len(shots), 1)
+        self.assertEqual(shots[0][1], [8, 1])
+
+    def test_cheap_kill_first(self):
+        planner = ShotPlanner([[5, 1]], {1: 1, 2: 2})
+        shots = planner.plan(snapshot((1, 5, ship(0, "battleship")), (2, 5, ship(1, "destroyer", hits=1))))
+        self.assertEqual(shots, [(2, [5, 1], 1)])
+
+    def test_destroyer_sunk_with_two_cannons(self):
+        planner = ShotPlanner([[5, 1], [5, 2]], {1: 1, 2: 2, 3: 3})
+        shots = planner.plan(snapshot((2, 5, ship(0, "destroyer"))))
+        self.assertEqual(sorted(shots), [(2, [5, 1], 0), (2, [5, 2], 0)])
+
+    def test_partial_hit_only_on_ships_staying_on_the_river(self):
+        planner = ShotPlanner(CANNONS, RIVERS)
+        self.assertEqual(planner.plan(snapshot((1, 3, ship(0, "battleship")))), [(1, [3, 0], 0)])
+        # On the last bridge it gets through before a second hit
+        self.assertEqual(planner.plan(snapshot((1, 8, ship(0, "battleship")))), [])
+
+    def test_least_demanded_cannon_fires_first(self):
+        # (5, 1) reaches both ships, (5, 2) only the one on river 2
+        planner = ShotPlanner([[5, 1], [5, 2]], {1: 1, 2: 2, 3: 3})
+        shots = planner.plan(snapshot((2, 5, ship(0, "frigate")), (1, 5, ship(1, "frigate"))))
+        self.assertEqual(sorted(shots), [(1, [5, 1], 1), (2, [5, 2], 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
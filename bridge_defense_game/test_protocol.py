@@ -0,0 +1,98 @@
+import json
+import struct
+import unittest
+
+import protocol
+
+
+HANDLE = 0x0123456789abcdef
+
+SHIPS = [{"id": 7, "hull": "frigate", "hits": 0}, {"id": 2 ** 32 - 1, "hull": "battleship", "hits": 2}]
+
+MESSAGES = [
+    {"type": "state", "turn": 3, "bridge": 8, "ships": SHIPS},
+    {"type": "state", "turn": 0, "bridge": 1, "ships": []},
+    {"type": "riverstate", "turn": 2 ** 32 - 1,
+     "bridges": {bridge: SHIPS if bridge == 4 else [] for bridge in range(1, protocol.N_BRIDGES + 1)}},
+    {"type": "shotresp", "cannon": [8, 4], "id": 12, "status": 1},
+    {"type": "cannons", "cannons": [[1, 0], [3, 0], [8, 1], [2, 2], [3, 3], [8, 4]]},
+    {"type": "gameover", "status": 0, "score": 17},
+]
+
+REQUESTS = [
+    ({"type": "getturn", "turn": 5}, dict(turn=5)),
+    ({"type": "shot", "cannon": [2, 2], "id": 9}, dict(cannon=[2, 2], ship_id=9)),
+    ({"type": "getcannons"}, {}),
+    ({"type": "quit"}, {}),
+]
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_messages(self):
+        for message in MESSAGES:
+            with self.subTest(type=message["type"]):
+                data = protocol.encode_message(dict(message, auth="gas"), HANDLE)
+                self.assertTrue(protocol.is_binary(data, protocol.MESSAGE_FRAMES))
+                self.assertEqual(protocol.FRAME.unpack_from(data)[1], HANDLE)
+                self.assertEqual(protocol.decode_message(data), message)
+
+    def test_requests(self):
+        for request, fields in REQUESTS:
+            with self.subTest(type=request["type"]):
+                data = protocol.encode_request(request["type"], HANDLE, **fields)
+                self.assertTrue(protocol.is_binary(data))
+                self.assertEqual(protocol.decode_request(data), (HANDLE, request))
+
+    def test_no_frame_for_authreq(self):
+        with self.assertRaises(ValueError):
+            protocol.encode_request("authreq", HANDLE)
+        with self.assertRaises(ValueError):
+            protocol.encode_message({"type": "authresp"}, HANDLE)
+
+
+class RejectionTest(unittest.TestCase):
+    def test_json_is_not_binary(self):
+        request = json.dumps({"type": "getturn", "auth": "gas", "turn": 1}).encode()
+        for prefix in (b'', b' ', b'\t', b'\r\n', b'\n\n  '):
+            with self.subTest(prefix=prefix):
+                self.assertFalse(protocol.is_binary(prefix + request))
+
+    def test_short_data_is_not_binary(self):
+        self.assertFalse(protocol.is_binary(b''))
+        self.assertFalse(protocol.is_binary(protocol.FRAME.pack(protocol.QUIT, HANDLE)[:-1]))
+
+    def test_request_lengths(self):
+        for request, fields in REQUESTS:
+            data = protocol.encode_request(request["type"], HANDLE, **fields)
+            for bad in (data[:-1], data + b'\0'):
+                with self.subTest(type=request["type"], length=len(bad)):
+                    with self.assertRaises((ValueError, struct.error)):
+                        protocol.decode_request(bad)
+
+    def test_message_lengths(self):
+        for message in MESSAGES:
+            data = protocol.encode_message(message, HANDLE)
+            for bad in (data[:-1], data + b'\0'):
+                with self.subTest(type=message["type"], length=len(bad)):
+                    with self.assertRaises((ValueError, struct.error)):
+                        protocol.decode_message(bad)
+
+    def test_message_frame_as_request(self):
+        data = protocol.encode_message(MESSAGES[-1], HANDLE)
+        self.assertFalse(protocol.is_binary(data))
+        with self.assertRaises(ValueError):
+            protocol.decode_request(data)
+
+    def test_unknown_hull_code(self):
+        data = bytearray(protocol.encode_message(MESSAGES[0], HANDLE))
+        # Hull byte of the first ship
+        data[protocol.STATE_HEADER.size + protocol.COUNT.size + 4] = len(protocol.HULLS)
+        with self.assertRaises(ValueError):
+            protocol.decode_message(bytes(data))
+        with self.assertRaises(KeyError):
+            protocol.encode_message({"type": "state", "turn": 0, "bridge": 1,
+                                     "ships": [{"id": 0, "hull": "submarine", "hits": 0}]}, HANDLE)
+
+
+if __name__ == '__main__':
+    unittest.main()
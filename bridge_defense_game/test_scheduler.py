@@ -0,0 +1,61 @@
+import unittest
+
+from scheduler import TurnScheduler
+
+
+class Session:
+    def __init__(self, name):
+        self.name = name
+        self.turns = 0
+
+
+class TurnSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.closed = set()
+        self.scheduler = TurnScheduler(1.0, self.advance, lambda session: session.name not in self.closed)
+
+    def advance(self, session):
+        session.turns += 1
+
+    def test_nothing_due_before_interval(self):
+        session = Session('a')
+        self.scheduler.add(session, now=0)
+        self.assertEqual(self.scheduler.next_deadline(), 1.0)
+        self.scheduler.run_due(now=0.5)
+        self.assertEqual(session.turns, 0)
+
+    def test_due_sessions_advance_once_per_interval(self):
+        a, b = Session('a'), Session('b')
+        self.scheduler.add(a, now=0)
+        self.scheduler.add(b, now=0.5)
+        self.scheduler.run_due(now=1.0)
+        self.assertEqual((a.turns, b.turns), (1, 0))
+        self.assertEqual(self.scheduler.next_deadline(), 1.5)
+        self.scheduler.run_due(now=2.0)
+        self.assertEqual((a.turns, b.turns), (2, 1))
+
+    def test_late_loop_does_not_drift(self):
+        session = Session('a')
+        self.scheduler.add(session, now=0)
+        self.scheduler.run_due(now=1.25)
+        self.assertEqual(self.scheduler.next_deadline(), 2.0)
+
+    def test_missed_turns_are_not_replayed_at_once(self):
+        session = Session('a')
+        self.scheduler.add(session, now=0)
+        self.scheduler.run_due(now=5.5)
+        self.assertEqual(session.turns, 1)
+        self.assertEqual(self.scheduler.next_deadline(), 6.5)
+
+    def test_closed_sessions_are_dropped(self):
+        session = Session('a')
+        self.scheduler.add(session, now=0)
+        self.closed.add('a')
+        self.scheduler.run_due(now=1.0)
+        self.assertEqual(session.turns, 0)
+        self.assertEqual(len(self.scheduler), 0)
+        self.assertIsNone(self.scheduler.next_deadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from sessions import SessionManager
+
+
+class SessionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.games = 0
+        self.opened = []
+        self.sessions = SessionManager(self.new_game, max_sessions=3, timeout=10, on_open=self.opened.append)
+
+    def new_game(self):
+        self.games += 1
+        return self.games
+
+    def test_open_resumes_running_game(self):
+        first = self.sessions.open('gas')
+        self.assertIs(self.sessions.open('gas'), first)
+        self.assertEqual(self.games, 1)
+        self.assertEqual(self.opened, [first])
+
+    def test_lookup_by_key_and_handle(self):
+        session = self.sessions.open('gas')
+        self.assertIs(self.sessions.get('gas'), session)
+        self.assertIs(self.sessions.by_handle(session.handle), session)
+        self.assertIsNone(self.sessions.get('other'))
+        self.assertIsNone(self.sessions.by_handle(session.handle + 1))
+
+    def test_handles_are_unique(self):
+        handles = {self.sessions.open(key).handle for key in ('a', 'b', 'c')}
+        self.assertEqual(len(handles), 3)
+
+    def test_least_recently_active_is_evicted(self):
+        a = self.sessions.open('a')
+        self.sessions.open('b')
+        self.sessions.open('c')
+        self.sessions.get('a')
+        self.sessions.open('d')
+        self.assertEqual(len(self.sessions), 3)
+        self.assertIsNone(self.sessions.get('b'))
+        self.assertIs(self.sessions.get('a'), a)
+
+    def test_close(self):
+        session = self.sessions.open('gas')
+        self.assertIs(self.sessions.close('gas'), session)
+        self.assertFalse(self.sessions.is_open(session))
+        self.assertIsNone(self.sessions.by_handle(session.handle))
+        self.assertIsNone(self.sessions.close('gas'))
+        self.assertIsNot(self.sessions.open('gas'), session)
+
+    def test_expire_idle_sessions(self):
+        a = self.sessions.open('a')
+        b = self.sessions.open('b')
+        a.last_seen, b.last_seen = 100, 105
+        self.sessions.sessions.move_to_end('b')
+        self.assertEqual(self.sessions.next_expiry(), 110)
+        self.assertEqual(self.sessions.expire(now=109), [])
+        self.assertEqual(self.sessions.expire(now=112), [a])
+        self.assertIsNone(self.sessions.by_handle(a.handle))
+        self.assertEqual(self.sessions.expire(now=115), [b])
+        self.assertIsNone(self.sessions.next_expiry())
+
+
+if __name__ == '__main__':
+    unittest.main()